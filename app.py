@@ -1,87 +1,219 @@
 import gradio as gr
+import json
 import os
-import subprocess
+import queue
 import shutil
+import threading
 
-def run_inference(model, video, seed, res_h, res_w, sp_size, out_fps, cfg_scale, cfg_rescale, sample_steps):
-    print("--- Running inference ---")
-    # Set the input and output paths
-    input_path = "/tmp/input_video"
-    output_path = "/tmp/output_video"
-    os.makedirs(input_path, exist_ok=True)
-    os.makedirs(output_path, exist_ok=True)
+from bucketing import bucket_key, clip_bytes
+from job_queue import JobQueue, device_memory_gb
+from model_registry import get_model_spec, selected_models
+from profiling import PrometheusMetrics, load_records
+from result_cache import ResultCache
+from worker_pool import WorkerCancelled, WorkerPool
+
+# Warm workers keep the configured runner loaded between jobs. Only one model
+# stays resident by default; idle workers are stopped after the timeout.
+worker_pool = WorkerPool(
+    idle_timeout=float(os.environ.get("SEEDVR_WORKER_IDLE_TIMEOUT", 600)),
+    max_workers=int(os.environ.get("SEEDVR_MAX_WORKERS", 1)),
+)
+
+# Finished outputs keyed by input bytes + generation parameters, so a
+# resubmitted job is answered from disk. A size of 0 disables the cache.
+result_cache = ResultCache(
+    os.environ.get("SEEDVR_RESULT_CACHE_DIR", "/workspace/result_cache"),
+    max_bytes=int(float(os.environ.get("SEEDVR_RESULT_CACHE_GB", 20)) * 1024 ** 3),
+)
+
+# Jobs run in private workspaces and are admitted by estimated GPU memory,
+# at most one per warm worker.
+job_queue = JobQueue(
+    os.environ.get("SEEDVR_JOB_DIR", "/tmp/seedvr_jobs"),
+    capacity_gb=float(os.environ.get("SEEDVR_GPU_MEMORY_GB", 0)) or device_memory_gb(),
+    max_running=worker_pool.max_workers,
+    ttl=float(os.environ.get("SEEDVR_JOB_TTL", 3600)),
+)
+
+# Per-stage profiles of every job are appended to SEEDVR_PROFILE_LOG when it
+# is set; SEEDVR_METRICS=1 serves them with queue and cache stats at /metrics.
+PROFILE_LOG = os.environ.get("SEEDVR_PROFILE_LOG")
+METRICS_ENABLED = os.environ.get("SEEDVR_METRICS", "0") == "1"
+metrics = PrometheusMetrics()
+metrics.add_gauge("result_cache", "Result cache counters", result_cache.stats)
+metrics.add_gauge(
+    "job_queue_jobs", "Jobs waiting and running",
+    lambda: {k: v for k, v in job_queue.stats().items() if k != "durations"},
+)
+metrics.add_gauge("job_duration_seconds", "Smoothed job duration per model", lambda: job_queue.stats()["durations"])
+
+def _record_profile(model, path):
+    records = load_records(path)
+    if PROFILE_LOG:
+        with open(PROFILE_LOG, "a") as f:
+            for record in records:
+                f.write(json.dumps(dict(record, model=model)) + "\n")
+    metrics.observe(records, model=model)
 
-    # Save the uploaded video
+def estimate_job_memory_gb(model, path, res_h, res_w, sp_size):
+    """Model weights plus the activation estimate used for batching."""
+    spec = get_model_spec(model)
+    try:
+        activations_gb = clip_bytes(bucket_key(path, res_h, res_w, sp_size)) / 1024 ** 3
+    except Exception as e:
+        print(f"Could not probe {path}, assuming {spec.headroom_gb} GB of activations: {e}")
+        activations_gb = spec.headroom_gb
+    return spec.weights_gb + activations_gb
+
+def _queue_status(job):
+    position = job_queue.position(job)
+    eta = job_queue.eta(job)
+    eta_text = "unknown" if eta is None else f"~{int(eta // 60)}m {int(eta % 60)}s"
+    return f"Queued: position {position}, estimated start in {eta_text}"
+
+STAGE_LABELS = {
+    "decode": "Decoding",
+    "vae_encode": "VAE encoding",
+    "dit": "Restoring",
+    "vae_decode": "VAE decoding",
+    "color_fix": "Colour fix",
+    "encode": "Encoding",
+    "preview": "Finished segment",
+    "written": "Written",
+}
+
+def _progress_status(event):
+    stage = event["stage"]
+    text = STAGE_LABELS.get(stage, stage)
+    if stage == "dit":
+        return f"{text}: step {event['step']}/{event['steps']}"
+    if "inputs" in event:
+        text += f" {', '.join(event['inputs'])}"
+    elif "input" in event:
+        text += f" {event['input']}"
+    frames = event.get("frames")
+    if stage == "preview":
+        return f"{text}: frames {frames[0]}-{frames[1]}"
+    if frames is not None and stage != "vae_encode":
+        total = event.get("total")
+        text += f": {frames}/{total} frames" if total else f": {frames} frames"
+    return text
+
+def run_inference(model, video, seed, res_h, res_w, sp_size, out_fps, cfg_scale, cfg_rescale, sample_steps, color_fix, adain_stats):
+    print("--- Running inference ---")
+    if video is None:
+        yield "Please upload a video.", None, None
+        return
+    if model not in selected_models():
+        yield "Invalid model selected.", None, None
+        return
     print(f"Input video: {video.name}")
-    video_filename = os.path.join(input_path, os.path.basename(video.name))
-    shutil.copy(video.name, video_filename)
-    print(f"Video saved to: {video_filename}")
-
-    # Determine which script to run
-    if model == "3B":
-        script_name = "projects/inference_seedvr2_3b.py"
-    elif model == "7B":
-        script_name = "projects/inference_seedvr2_7b.py"
-    else:
-        return "Invalid model selected."
-    print(f"Using script: {script_name}")
-
-    # Construct the command
-    command = [
-        "torchrun",
-        "--nproc-per-node=1",
-        script_name,
-        "--video_path", input_path,
-        "--output_dir", output_path,
-        "--seed", str(seed),
-        "--res_h", str(res_h),
-        "--res_w", str(res_w),
-        "--sp_size", str(sp_size),
-    ]
-
-    if out_fps:
-        command.extend(["--out_fps", str(out_fps)])
-
-    print(f"Command: {' '.join(command)}")
-
-    # Set environment variables for the new parameters
-    env = os.environ.copy()
-    env["CFG_SCALE"] = str(cfg_scale)
-    env["CFG_RESCALE"] = str(cfg_rescale)
-    env["SAMPLE_STEPS"] = str(sample_steps)
-
-    # Run the command
+
+    params = {
+        "seed": int(seed),
+        "res_h": int(res_h),
+        "res_w": int(res_w),
+        "out_fps": float(out_fps) if out_fps else None,
+        "cfg_scale": float(cfg_scale),
+        "cfg_rescale": float(cfg_rescale),
+        "sample_steps": int(sample_steps),
+        "color_fix": color_fix,
+        "adain_stats": adain_stats,
+    }
+    sp_size = int(sp_size)
+
+    cache_key = None
+    if result_cache.enabled:
+        cache_key = result_cache.key(video.name, dict(params, model=model, sp_size=sp_size))
+        cached = result_cache.get(cache_key)
+        print(f"Result cache: {result_cache.stats()}")
+        if cached is not None:
+            print(f"Returning cached result: {cached}")
+            yield "Done (cached result).", None, cached
+            return
+
+    # Each job restores only its own upload, in its own workspace.
+    memory_gb = estimate_job_memory_gb(model, video.name, params["res_h"], params["res_w"], sp_size)
+    job = job_queue.submit(model, (model, sp_size), memory_gb)
+    print(f"Job {job.id}: {model}, estimated {memory_gb:.1f} GB")
+    # The job runs on a thread so progress can be streamed from here; closing
+    # this generator (Cancel button, closed page) cancels it on the worker.
+    cancel = threading.Event()
+    events = queue.Queue()
+    result = {}
+    runner = None
+
+    def _run():
+        status = "error"
+        try:
+            result["outputs"] = worker_pool.run(
+                model, params, sp_size=sp_size, on_event=events.put, cancel=cancel
+            )
+            status = "ok"
+        except WorkerCancelled as e:
+            result["error"] = e
+            status = "cancelled"
+        except Exception as e:
+            # WorkerError, or e.g. torchrun missing when the worker starts
+            result["error"] = e
+        finally:
+            job_queue.finish(job)
+            metrics.inc("jobs_total", (("model", model), ("status", status)))
+            if params.get("profile"):
+                _record_profile(model, params["profile"])
+            events.put(None)
+
     try:
-        result = subprocess.run(command, check=True, text=True, capture_output=True, env=env)
-        print("--- Inference stdout ---")
-        print(result.stdout)
-        print("--- Inference stderr ---")
-        print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Error during inference: {e}")
-        print(f"--- Error stdout ---")
-        print(e.stdout)
-        print(f"--- Error stderr ---")
-        print(e.stderr)
-        return f"Error: {e.stderr}"
-
-    # Get the output file
-    print(f"Output directory content: {os.listdir(output_path)}")
-    output_files = os.listdir(output_path)
+        while not job_queue.wait(job, timeout=2):
+            yield _queue_status(job), None, None
+
+        video_filename = os.path.join(job.input_dir, os.path.basename(video.name))
+        shutil.copy(video.name, video_filename)
+        params.update(video_path=job.input_dir, output_dir=job.output_dir)
+        if PROFILE_LOG or METRICS_ENABLED:
+            params["profile"] = os.path.join(job.output_dir, ".profile.jsonl")
+        print(f"Submitting job {job.id} to {model} worker: {params}")
+        yield "Running...", None, None
+
+        # Run the job on the warm worker for this model
+        runner = threading.Thread(target=_run, daemon=True)
+        runner.start()
+        preview = None
+        for event in iter(events.get, None):
+            if event["stage"] == "preview":
+                preview = event["path"]
+            yield _progress_status(event), preview, None
+    finally:
+        if runner is None:
+            job_queue.finish(job)
+        elif runner.is_alive():
+            print(f"Cancelling job {job.id}")
+            cancel.set()
+
+    if "error" in result:
+        print(f"Error during inference: {result['error']}")
+        yield f"Error: {result['error']}", preview, None
+        return
+
+    # The worker reports the files it wrote
+    output_files = result["outputs"]
+    print(f"Output files: {output_files}")
     if not output_files:
-        return "No output file generated."
+        yield "No output file generated.", preview, None
+        return
 
-    output_video_path = os.path.join(output_path, output_files[0])
+    output_video_path = output_files[0]
+    if cache_key is not None:
+        output_video_path = result_cache.put(cache_key, output_video_path)
     print(f"Output video path: {output_video_path}")
-
-    return output_video_path
+    yield "Done.", preview, output_video_path
 
 # Create the Gradio interface
 with gr.Blocks() as demo:
     gr.Markdown("# SeedVR Video Restoration")
     with gr.Row():
         with gr.Column():
-            model = gr.Dropdown(["3B", "7B"], label="Model", value="3B")
+            model = gr.Dropdown(selected_models(), label="Model", value=selected_models()[0])
             video = gr.File(label="Input Video")
             seed = gr.Number(label="Seed", value=666)
             res_h = gr.Number(label="Output Height", value=720)
@@ -91,16 +223,45 @@ with gr.Blocks() as demo:
             cfg_scale = gr.Slider(minimum=0.0, maximum=2.0, value=1.0, label="CFG Scale")
             cfg_rescale = gr.Slider(minimum=0.0, maximum=1.0, value=0.0, label="CFG Rescale")
             sample_steps = gr.Slider(minimum=1, maximum=10, step=1, value=1, label="Sample Steps")
+            color_fix = gr.Dropdown(
+                ["wavelet", "pyramid", "adain", "none"], label="Colour Fix", value="wavelet",
+                info="wavelet is exact, pyramid approximates it faster, adain is the cheapest",
+            )
+            adain_stats = gr.Dropdown(
+                ["ema", "clip", "frame"], label="AdaIN Statistics", value="ema",
+                info="Only used by adain: per frame smoothed over time, per clip, or per frame",
+            )
             run_button = gr.Button("Run Inference")
+            cancel_button = gr.Button("Cancel")
         with gr.Column():
+            status = gr.Markdown()
+            preview_image = gr.Image(label="Preview", type="filepath")
             output_video = gr.Video(label="Output Video")
 
-    run_button.click(
+    run_event = run_button.click(
         fn=run_inference,
-        inputs=[model, video, seed, res_h, res_w, sp_size, out_fps, cfg_scale, cfg_rescale, sample_steps],
-        outputs=output_video,
+        inputs=[model, video, seed, res_h, res_w, sp_size, out_fps, cfg_scale, cfg_rescale, sample_steps, color_fix, adain_stats],
+        outputs=[status, preview_image, output_video],
     )
+    cancel_button.click(fn=None, cancels=[run_event])
+    # Jobs wait in job_queue rather than in Gradio's queue, so they can
+    # report their position; admission is decided there.
+    demo.queue(default_concurrency_limit=None)
 
 if __name__ == "__main__":
-    _, _, share_url = demo.launch(server_name="0.0.0.0", server_port=7860, share=True)
-    print(f"Gradio share URL: {share_url}")
\ No newline at end of file
+    server, _, share_url = demo.launch(
+        server_name="0.0.0.0", server_port=7860, share=True, prevent_thread_lock=True,
+        # outputs and previews live outside the working directory
+        allowed_paths=[result_cache.root, job_queue.root],
+    )
+    print(f"Gradio share URL: {share_url}")
+    if METRICS_ENABLED:
+        from fastapi.responses import PlainTextResponse
+
+        server.add_api_route(
+            "/metrics", lambda: PlainTextResponse(metrics.render()), methods=["GET"]
+        )
+        # ahead of Gradio's own routes
+        server.router.routes.insert(0, server.router.routes.pop())
+        print("Prometheus metrics at /metrics")
+    demo.block_thread()
\ No newline at end of file
@@ -0,0 +1,345 @@
+"""Benchmarks for the host-side parts of the restoration pipeline.
+
+Runs on a plain CPU machine with torch installed:
+
+    python benchmark.py colorfix --resolutions 720p 1080p 2160p --frames 4
+    python benchmark.py pipeline --seedvr_root /workspace/SeedVR --clips 4 --frames 33 --resolution 480p
+
+``pipeline`` runs ``generation_loop`` on synthetic clips with ``StubRunner``
+in place of ``VideoDiffusionInfer``. It needs a SeedVR checkout for the
+transforms, and ffmpeg, but no GPU and no checkpoints. It reports frames/s
+and peak memory per stage from the ``--profile`` records.
+
+``colorfix`` times the reference ``wavelet_reconstruction`` against
+``wavelet_color_transfer`` in its exact (``wavelet``) and approximate
+(``pyramid``) modes and the AdaIN transfer, and reports PSNR and CIE76 ΔE
+of the pyramid result against the exact one.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import torch
+import torch.nn.functional as F
+from einops import rearrange
+
+from color_fix import adain_color_transfer, wavelet_color_transfer, wavelet_reconstruction
+
+RESOLUTIONS = {
+    "480p": (480, 854),
+    "720p": (720, 1280),
+    "1080p": (1080, 1920),
+    "2160p": (2160, 3840),
+}
+
+
+def _smooth_noise(frames, height, width, cells, generator):
+    noise = torch.rand(frames, 3, cells, cells, generator=generator) * 2 - 1
+    return F.interpolate(noise, size=(height, width), mode="bicubic", align_corners=False)
+
+
+def synthetic_pair(frames, height, width, seed=0, image=None):
+    """
+    A ``(content, style)`` pair in [-1, 1]. ``style`` plays the degraded input
+    (smooth colour regions with hard edges, or ``image`` when given) and
+    ``content`` the restored output: the same frame with a spatially varying
+    colour cast and fine detail added.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    if image is not None:
+        style = F.interpolate(image[None].float() / 127.5 - 1, size=(height, width),
+                              mode="bilinear", align_corners=False).repeat(frames, 1, 1, 1)
+    else:
+        style = _smooth_noise(frames, height, width, 6, generator)
+        # hard edges between colour regions
+        blocks = _smooth_noise(frames, height, width, 12, generator).sign() * 0.3
+        style = (style + blocks).clamp(-1, 1)
+    cast = _smooth_noise(frames, height, width, 4, generator) * 0.15
+    detail = (torch.rand(style.shape, generator=generator) * 2 - 1) * 0.05
+    content = (style + cast + detail).clamp(-1, 1)
+    return content, style
+
+
+def _timed(fn, device, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        result = fn()
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def rgb_to_lab(image):
+    """CIE L*a*b* (D65) of sRGB ``(T, 3, H, W)`` frames in [-1, 1]."""
+    rgb = ((image.float() + 1) / 2).clamp(0, 1)
+    linear = torch.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    matrix = torch.tensor([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ], dtype=linear.dtype, device=linear.device)
+    xyz = torch.einsum("ij,tjhw->tihw", matrix, linear)
+    white = torch.tensor([0.95047, 1.0, 1.08883], dtype=xyz.dtype, device=xyz.device)
+    xyz = xyz / white.view(1, 3, 1, 1)
+    f = torch.where(xyz > (6 / 29) ** 3, xyz.pow(1 / 3), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return torch.stack([
+        116 * f[:, 1] - 16,
+        500 * (f[:, 0] - f[:, 1]),
+        200 * (f[:, 1] - f[:, 2]),
+    ], dim=1)
+
+
+def psnr(result, target):
+    """PSNR in dB of two [-1, 1] tensors on the 8-bit [0, 1] scale."""
+    a = ((result.float() + 1) / 2).clamp(0, 1)
+    b = ((target.float() + 1) / 2).clamp(0, 1)
+    mse = (a - b).pow(2).mean().item()
+    return float("inf") if mse == 0 else 10 * torch.log10(torch.tensor(1 / mse)).item()
+
+
+def bench_colorfix(args):
+    device = torch.device(args.device)
+    image = None
+    if args.image:
+        from torchvision.io import read_image
+        image = read_image(args.image)[:3]
+    header = (
+        f"{'resolution':>10} {'reference':>10} {'wavelet':>10} {'pyramid':>10} {'adain':>10} "
+        f"{'max|w-ref|':>11} {'PSNR dB':>8} {'ΔE mean':>8} {'ΔE p99':>8} {'ΔE max':>8}"
+    )
+    print(f"seconds per frame, {args.frames} frames, device {device}")
+    print(header)
+    for name in args.resolutions:
+        height, width = RESOLUTIONS[name]
+        content, style = synthetic_pair(args.frames, height, width, image=image)
+
+        reference_time, reference = float("nan"), None
+        if not args.no_reference:
+            reference_time, reference = _timed(
+                lambda: wavelet_reconstruction(content, style), torch.device("cpu"), args.repeat
+            )
+        wavelet_time, exact = _timed(
+            lambda: wavelet_color_transfer(content, style, device=device, out_device="cpu"),
+            device, args.repeat,
+        )
+        pyramid_time, approx = _timed(
+            lambda: wavelet_color_transfer(content, style, device=device, out_device="cpu", mode="pyramid"),
+            device, args.repeat,
+        )
+        adain_time, _ = _timed(
+            lambda: adain_color_transfer(content, style, device=device, out_device="cpu"),
+            device, args.repeat,
+        )
+
+        max_error = float("nan") if reference is None else (exact - reference).abs().max().item()
+        delta_e = (rgb_to_lab(approx) - rgb_to_lab(exact)).norm(dim=1).flatten()
+        # torch.quantile is limited to 2**24 elements
+        p99 = delta_e[::max(1, delta_e.numel() // 2 ** 24 + 1)].quantile(0.99).item()
+        print(
+            f"{name:>10} {reference_time / args.frames:>10.4f} {wavelet_time / args.frames:>10.4f} "
+            f"{pyramid_time / args.frames:>10.4f} {adain_time / args.frames:>10.4f} {max_error:>11.2e} {psnr(approx, exact):>8.2f} "
+            f"{delta_e.mean().item():>8.3f} {p99:>8.3f} {delta_e.max().item():>8.3f}"
+        )
+
+
+class StubRunner:
+    """
+    Stands in for ``VideoDiffusionInfer`` with the interface generation_loop
+    uses. No weights are loaded, but the tensors come out in the shapes the
+    real runner produces: ``vae_encode`` returns ``(t, h, w, c)`` latents at
+    1/4 temporal and 1/8 spatial resolution, and ``inference`` decodes back to
+    ``(c, t, h, w)`` videos. The DiT is still called once per step (twice
+    with guidance), so progress hooks fire as usual.
+    """
+
+    def __init__(self, model="3B", latent_channels=16):
+        from omegaconf import OmegaConf
+        from residency import ResidencyManager
+
+        self.model = model
+        self.latent_channels = latent_channels
+        self.config = OmegaConf.create({
+            "diffusion": {"cfg": {"scale": 1.0, "rescale": 0.0}, "timesteps": {"sampling": {"steps": 1}}},
+        })
+        self.dit = torch.nn.Identity()
+        self.vae = torch.nn.Identity()
+        self.schedule = SimpleNamespace(forward=lambda x, noise, t: x)
+        self.residency = ResidencyManager({"dit": self.dit, "vae": self.vae}, "cpu")
+
+    def configure_diffusion(self):
+        pass
+
+    def timestep_transform(self, t, shape):
+        return t
+
+    def vae_encode(self, samples):
+        latents = []
+        for sample in samples:
+            frames = F.avg_pool2d(rearrange(sample[:, ::4], "c t h w -> t c h w"), 8)
+            repeats = -(-self.latent_channels // frames.size(1))
+            latent = frames.repeat(1, repeats, 1, 1)[:, :self.latent_channels]
+            latents.append(rearrange(latent, "t c h w -> t h w c"))
+        return latents
+
+    def get_condition(self, latent, latent_blur, task):
+        return torch.cat([latent_blur, torch.ones_like(latent[..., :1])], dim=-1)
+
+    def inference(self, noises, conditions, texts_pos, texts_neg, dit_offload=False, **kwargs):
+        # the same contract as VideoDiffusionInfer.inference
+        assert len(noises) == len(conditions) == len(texts_pos) == len(texts_neg), (
+            len(noises), len(texts_pos)
+        )
+        steps = self.config.diffusion.timesteps.sampling.steps
+        calls = 1 if self.config.diffusion.cfg.scale == 1.0 else 2
+        videos = []
+        for noise, condition in zip(noises, conditions):
+            latent = condition[..., :noise.size(-1)]
+            for _ in range(steps * calls):
+                latent = self.dit(latent)
+            t, h, w, _ = latent.shape
+            video = rearrange(latent[..., :3], "t h w c -> 1 c t h w")
+            video = F.interpolate(video, size=(4 * (t - 1) + 1, 8 * h, 8 * w), mode="trilinear")
+            videos.append(video[0].clamp_(-1, 1))
+        return videos
+
+
+def _synthetic_clip(path, frames, height, width, fps=24):
+    from video_io import VideoWriter
+
+    y = torch.linspace(0, 1, height).view(1, height, 1)
+    x = torch.linspace(0, 1, width).view(1, 1, width)
+    with VideoWriter(path, fps, preset="ultrafast") as writer:
+        for t in range(frames):
+            phase = t / max(1, frames)
+            frame = torch.stack([
+                (x + phase) % 1,
+                (y + 2 * phase) % 1,
+                ((x + y) / 2 + phase) % 1,
+            ], dim=-1)[0]
+            writer.write((frame * 255).to(torch.uint8)[None])
+
+
+def bench_pipeline(args):
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    seedvr_root = os.path.abspath(args.seedvr_root)
+    sys.path.insert(0, seedvr_root)
+    # the engine looks for the colour fix relative to the SeedVR checkout
+    os.chdir(seedvr_root)
+    import seedvr_engine
+    from bucketing import bucket_inputs, probe_keys
+    from scheduling import estimate_costs, partition_lpt
+
+    work = tempfile.mkdtemp(prefix="seedvr_bench_")
+    os.chdir(work)
+    os.makedirs("inputs")
+    height, width = RESOLUTIONS[args.resolution]
+    for i in range(args.clips):
+        _synthetic_clip(os.path.join("inputs", f"clip{i:03d}.mp4"), args.frames, height, width)
+    # text embeddings are only passed through by the stub
+    torch.save(torch.zeros(1, 16), "pos_emb.pt")
+    torch.save(torch.zeros(1, 16), "neg_emb.pt")
+    print(f"{args.clips} clips of {args.frames} frames at {width}x{height} in {work}")
+
+    names = sorted(os.listdir("inputs"))
+    start = time.perf_counter()
+    keys = probe_keys(names, "inputs", args.res_h, args.res_w, 1)
+    groups = partition_lpt(names, estimate_costs(names, keys), args.groups)
+    for group in groups:
+        bucket_inputs(group, keys, batch_size=args.batch_size)
+    schedule_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    seedvr_engine.generation_loop(
+        StubRunner(),
+        "inputs",
+        "outputs",
+        batch_size=args.batch_size,
+        sample_steps=args.steps,
+        res_h=args.res_h,
+        res_w=args.res_w,
+        color_fix=args.color_fix,
+        temporal_padding=args.temporal_padding,
+        prefetch=args.prefetch,
+        write_queue=args.write_queue,
+        profile="profile.jsonl",
+    )
+    total_time = time.perf_counter() - start
+
+    from profiling import load_records
+
+    stages = defaultdict(lambda: {"frames": 0, "seconds": 0.0, "bytes": 0, "peak_rss": 0, "peak_device": 0})
+    for record in load_records("profile.jsonl"):
+        stage = stages[record["stage"]]
+        stage["frames"] += record.get("frames", 0)
+        stage["seconds"] += record["wall_s"]
+        stage["bytes"] += record["bytes"]
+        stage["peak_rss"] = max(stage["peak_rss"], record["peak_rss_bytes"] or 0)
+        stage["peak_device"] = max(stage["peak_device"], record["peak_device_bytes"] or 0)
+
+    print(f"{'stage':>12} {'frames':>8} {'seconds':>9} {'frames/s':>9} {'peak RSS MB':>12} {'peak dev MB':>12} {'moved MB':>9}")
+    for name, stage in stages.items():
+        fps = stage["frames"] / stage["seconds"] if stage["seconds"] else float("nan")
+        stage["frames_per_second"] = fps
+        print(
+            f"{name:>12} {stage['frames']:>8} {stage['seconds']:>9.3f} {fps:>9.1f} "
+            f"{stage['peak_rss'] / 2 ** 20:>12.0f} {stage['peak_device'] / 2 ** 20:>12.0f} "
+            f"{stage['bytes'] / 2 ** 20:>9.1f}"
+        )
+    total_frames = args.clips * args.frames
+    print(f"scheduling {schedule_time:.3f}s, end to end {total_time:.2f}s, {total_frames / total_time:.1f} frames/s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "args": vars(args),
+                "stages": stages,
+                "schedule_seconds": schedule_time,
+                "total_seconds": total_time,
+                "frames_per_second": total_frames / total_time,
+            }, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    colorfix = subparsers.add_parser("colorfix", help="Colour fix speed and accuracy")
+    colorfix.add_argument("--resolutions", nargs="+", default=["480p", "720p", "1080p", "2160p"],
+                          choices=sorted(RESOLUTIONS))
+    colorfix.add_argument("--frames", type=int, default=4)
+    colorfix.add_argument("--repeat", type=int, default=2)
+    colorfix.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    colorfix.add_argument("--image", type=str, default=None,
+                          help="Use this image as the input frame instead of synthetic content")
+    colorfix.add_argument("--no_reference", action="store_true",
+                          help="Skip the slow reference wavelet_reconstruction")
+    colorfix.set_defaults(func=bench_colorfix)
+    pipeline = subparsers.add_parser("pipeline", help="generation_loop with a stub runner")
+    pipeline.add_argument("--seedvr_root", type=str, default="/workspace/SeedVR")
+    pipeline.add_argument("--clips", type=int, default=4)
+    pipeline.add_argument("--frames", type=int, default=33)
+    pipeline.add_argument("--resolution", type=str, default="480p", choices=sorted(RESOLUTIONS),
+                          help="Resolution of the synthetic input clips")
+    pipeline.add_argument("--res_h", type=int, default=720)
+    pipeline.add_argument("--res_w", type=int, default=1280)
+    pipeline.add_argument("--steps", type=int, default=1)
+    pipeline.add_argument("--batch_size", type=int, default=0)
+    pipeline.add_argument("--groups", type=int, default=4,
+                          help="Ranks to partition the clips for in the scheduling benchmark")
+    pipeline.add_argument("--color_fix", type=str, default="wavelet")
+    pipeline.add_argument("--temporal_padding", type=str, default="replicate",
+                          help="With trim, clips whose length is not 4k+1 are restored as two pieces")
+    pipeline.add_argument("--prefetch", type=int, default=1)
+    pipeline.add_argument("--write_queue", type=int, default=2)
+    pipeline.add_argument("--output", type=str, default=None, help="Write the results as JSON")
+    pipeline.set_defaults(func=bench_pipeline)
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,105 @@
+"""Shape-bucketed batching for generation_loop.
+
+Inputs are grouped by the spatial shape they will have after
+``NaResize(mode="area")`` + ``DivisibleCrop((16, 16))`` and by their padded
+temporal length, so every batch can go through ``vae_encode`` and
+``runner.inference`` together. The batch size of each bucket is derived from
+a device memory budget unless it is given explicitly.
+"""
+import math
+import os
+from collections import OrderedDict, namedtuple
+
+from PIL import Image
+
+from video_io import probe_video
+
+BucketKey = namedtuple("BucketKey", ["frames", "height", "width"])
+
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
+
+# Rough peak device memory per padded input pixel (all frames) through VAE
+# encode, DiT and VAE decode in bf16. Deliberately conservative.
+ACTIVATION_BYTES_PER_PIXEL = 512
+
+
+def resized_size(height, width, res_h, res_w, downsample_only=False):
+    """Output size of the NaResize area resize."""
+    scale = math.sqrt(res_h * res_w / (height * width))
+    if downsample_only:
+        scale = min(1.0, scale)
+    return round(height * scale), round(width * scale)
+
+
+def transformed_size(height, width, res_h, res_w, divisible=16, downsample_only=False):
+    """Output size of the NaResize area resize followed by DivisibleCrop."""
+    height, width = resized_size(height, width, res_h, res_w, downsample_only)
+    return height - height % divisible, width - width % divisible
+
+
+def padded_length(num_frames, sp_size):
+    """Number of frames after temporal padding of a clip of ``num_frames``."""
+    step = 4 * sp_size
+    if num_frames == 1:
+        return 1
+    if num_frames <= step:
+        return step + 1
+    return num_frames + (-(num_frames - 1)) % step
+
+
+def bucket_key(path, res_h, res_w, sp_size):
+    """Post-transform shape of one input, read from metadata only."""
+    if os.path.splitext(path.lower())[1] in IMAGE_EXTS:
+        with Image.open(path) as image:
+            width, height = image.size
+        frames = 1
+    else:
+        info = probe_video(path)
+        if not info.num_frames:
+            raise ValueError("frame count not available from metadata")
+        frames, height, width = info.num_frames, info.height, info.width
+    height, width = transformed_size(height, width, res_h, res_w)
+    return BucketKey(padded_length(frames, sp_size), height, width)
+
+
+def clip_bytes(key, bytes_per_pixel=ACTIVATION_BYTES_PER_PIXEL):
+    return key.frames * key.height * key.width * bytes_per_pixel
+
+
+def probe_keys(names, root, res_h, res_w, sp_size):
+    """Bucket key of every input, or None where the metadata cannot be read."""
+    keys = {}
+    for name in names:
+        try:
+            keys[name] = bucket_key(os.path.join(root, name), res_h, res_w, sp_size)
+        except Exception as e:
+            print(f"Could not probe {name}, processing it on its own: {e}")
+            keys[name] = None
+    return keys
+
+
+def bucket_inputs(names, keys, batch_size=0, memory_budget=None, max_batch_size=16):
+    """
+    Split ``names`` into batches of identically shaped inputs, using the
+    ``keys`` from ``probe_keys``. With ``batch_size`` 0 each bucket's batch
+    size is the number of clips whose estimated footprint fits in
+    ``memory_budget`` bytes, capped by ``max_batch_size``. Inputs without a
+    key get a batch of their own.
+    """
+    buckets = OrderedDict()
+    for name in names:
+        buckets.setdefault(keys.get(name), []).append(name)
+
+    batches = []
+    for key, items in buckets.items():
+        if key is None:
+            batches.extend([item] for item in items)
+            continue
+        size = batch_size
+        if size <= 0:
+            size = max_batch_size
+            if memory_budget is not None:
+                size = max(1, min(max_batch_size, memory_budget // clip_bytes(key)))
+        print(f"Bucket {tuple(key)}: {len(items)} inputs, batch size {size}")
+        batches.extend(items[i:i + size] for i in range(0, len(items), size))
+    return batches
@@ -0,0 +1,196 @@
+"""Fast checkpoint loading through a safetensors conversion cache.
+
+A pickled ``.pth`` has to be unpickled into host memory before it can be
+copied to the GPU. The first time a checkpoint is loaded it is converted to
+``<cache_dir>/<sha256>.safetensors``. Every later load memory-maps that
+file. The engine assigns the mapped tensors to a DiT built on the meta
+device and then moves the model to the GPU, so the weights are never held
+on the host or the device twice. Checkpoint hashes are remembered in
+``<cache_dir>/index.json`` by path, size and mtime, so a 16 GB checkpoint is
+only hashed once. Conversions are serialised with a lock file, so ranks
+starting together convert a checkpoint once.
+
+Convert ahead of time (e.g. right after downloading) with:
+
+    python checkpoint_cache.py convert ./ckpts/seedvr2_ema_3b.pth ./ckpts/seedvr2_ema_7b.pth
+
+Without paths, the checkpoints of the selected models (``SEEDVR_MODELS``) are
+converted.
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import torch
+
+try:
+    from safetensors.torch import load_file, save_file
+except ImportError:
+    load_file = save_file = None
+
+DEFAULT_CACHE_DIR = "./ckpts/safetensors"
+
+_index_lock = threading.Lock()
+# one hash of a checkpoint at a time per process; later callers read the index
+_digest_locks = defaultdict(threading.Lock)
+
+
+def _index_path(cache_dir):
+    return os.path.join(cache_dir, "index.json")
+
+
+def checkpoint_digest(path, cache_dir=DEFAULT_CACHE_DIR):
+    """SHA-256 of ``path``, memoized by its size and mtime."""
+    with _digest_locks[os.path.abspath(path)]:
+        return _checkpoint_digest(path, cache_dir)
+
+
+def _checkpoint_digest(path, cache_dir):
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    with _index_lock:
+        try:
+            with open(_index_path(cache_dir)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        entry = index.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+
+    start = time.perf_counter()
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(16 << 20), b""):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+    print(f"[checkpoint] hashed {path} in {time.perf_counter() - start:.1f}s")
+
+    with _index_lock:
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(_index_path(cache_dir)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        tmp = f"{_index_path(cache_dir)}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, _index_path(cache_dir))
+    return sha256
+
+
+def _unshared(state):
+    # safetensors refuses tensors that share storage; copy all but the first
+    seen = set()
+    tensors = {}
+    for name, tensor in state.items():
+        tensor = tensor.detach()
+        ptr = tensor.untyped_storage().data_ptr()
+        if ptr in seen:
+            tensor = tensor.clone()
+        seen.add(ptr)
+        tensors[name] = tensor.contiguous()
+    return tensors
+
+
+def convert(checkpoint, cache_dir=DEFAULT_CACHE_DIR):
+    """Return the safetensors conversion of ``checkpoint``, creating it once."""
+    os.makedirs(cache_dir, exist_ok=True)
+    # ranks starting together wait for the first one instead of converting too
+    lock_name = hashlib.sha1(os.path.abspath(checkpoint).encode("utf-8")).hexdigest()
+    with open(os.path.join(cache_dir, f"{lock_name}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            return _convert(checkpoint, cache_dir)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _convert(checkpoint, cache_dir):
+    target = os.path.join(cache_dir, f"{checkpoint_digest(checkpoint, cache_dir)}.safetensors")
+    if os.path.exists(target):
+        return target
+    start = time.perf_counter()
+    state = torch.load(checkpoint, map_location="cpu", mmap=True, weights_only=True)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    save_file(_unshared(state), tmp)
+    os.replace(tmp, target)
+    print(f"[checkpoint] converted {checkpoint} to {target} in {time.perf_counter() - start:.1f}s")
+    return target
+
+
+def load_state_dict(checkpoint, device="cpu", cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Load ``checkpoint`` onto ``device`` through the conversion cache. Falls
+    back to a memory-mapped ``torch.load`` when safetensors is not installed.
+    """
+    start = time.perf_counter()
+    if load_file is None:
+        state = torch.load(checkpoint, map_location=device, mmap=True, weights_only=True)
+    else:
+        if not checkpoint.endswith(".safetensors"):
+            checkpoint = convert(checkpoint, cache_dir)
+        state = load_file(checkpoint, device=str(device))
+    print(f"[checkpoint] loaded {checkpoint} in {time.perf_counter() - start:.1f}s")
+    return state
+
+
+def prewarm(checkpoint, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Ask the kernel to start reading the file a load of ``checkpoint`` will
+    read into the page cache. Runs in the background, including the hash
+    that finds the converted file.
+    """
+    def _advise():
+        try:
+            path = cached_path(checkpoint, cache_dir)
+        except OSError:
+            return
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except (AttributeError, OSError):
+            pass
+        finally:
+            os.close(fd)
+
+    thread = threading.Thread(target=_advise, daemon=True)
+    thread.start()
+    return thread
+
+
+def cached_path(checkpoint, cache_dir=DEFAULT_CACHE_DIR):
+    """The file a load of ``checkpoint`` will read, without converting it."""
+    if load_file is None or checkpoint.endswith(".safetensors"):
+        return checkpoint
+    target = os.path.join(cache_dir, f"{checkpoint_digest(checkpoint, cache_dir)}.safetensors")
+    return target if os.path.exists(target) else checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Convert checkpoints to safetensors ahead of time")
+    convert_parser.add_argument("checkpoints", nargs="*")
+    convert_parser.add_argument("--cache_dir", type=str, default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+    if save_file is None:
+        raise SystemExit("safetensors is not installed")
+    checkpoints = args.checkpoints
+    if not checkpoints:
+        from model_registry import get_model_spec, selected_models
+
+        checkpoints = [get_model_spec(model).checkpoint for model in selected_models()]
+        checkpoints = [checkpoint for checkpoint in checkpoints if os.path.exists(checkpoint)]
+    for checkpoint in checkpoints:
+        print(convert(checkpoint, args.cache_dir))
@@ -0,0 +1,64 @@
+"""Skipping of duplicate and static frames.
+
+Screen recordings, slides and archival footage often hold the same picture
+for many frames. ``collapse_static_runs`` finds runs of near-duplicate
+frames in a decoded clip. Only the first frame of each run is restored, and
+the writer repeats its output for the rest of the run, so the output keeps
+every frame at its original position in the timeline.
+
+Frames are compared on a 64x36 luma thumbnail. A frame joins the current
+run while its mean absolute difference to the run's first frame stays within
+``threshold`` (in 8-bit levels). Comparing to the first frame rather than
+the previous one keeps slow fades from being collapsed. Runs shorter than
+``min_run`` frames are restored in full, so ordinary footage with an
+occasional repeated frame is left alone.
+"""
+import torch
+import torch.nn.functional as F
+
+from bucketing import padded_length
+
+THUMBNAIL_SIZE = (36, 64)
+
+
+def _thumbnails(video, chunk_size=64):
+    thumbnails = []
+    for start in range(0, video.size(0), chunk_size):
+        luma = video[start:start + chunk_size].float().mean(1, keepdim=True)
+        thumbnails.append(F.adaptive_avg_pool2d(luma, THUMBNAIL_SIZE).cpu())
+    return torch.cat(thumbnails)
+
+
+def collapse_static_runs(video, threshold=1.0, min_run=4):
+    """
+    Find runs of near-duplicate frames in a uint8 ``(T, C, H, W)`` video.
+    Returns ``(keep, repeats)``: the indices of the frames to restore and the
+    number of output frames each of them stands for. Returns ``(None, None)``
+    when there is nothing to collapse.
+    """
+    if video.size(0) < min_run:
+        return None, None
+    thumbnails = _thumbnails(video)
+    runs = [[0, 1]]
+    for index in range(1, thumbnails.size(0)):
+        anchor = runs[-1][0]
+        if (thumbnails[index] - thumbnails[anchor]).abs().mean().item() <= threshold:
+            runs[-1][1] += 1
+        else:
+            runs.append([index, 1])
+    keep, repeats = [], []
+    for start, length in runs:
+        if length >= min_run:
+            keep.append(start)
+            repeats.append(length)
+        else:
+            keep += range(start, start + length)
+            repeats += [1] * length
+    if len(keep) == video.size(0):
+        return None, None
+    return torch.tensor(keep), torch.tensor(repeats)
+
+
+def compute_saved(frames, kept, sp_size=1):
+    """Share of the per-clip model work saved by restoring ``kept`` of ``frames`` frames."""
+    return 1 - padded_length(kept, sp_size) / padded_length(frames, sp_size)
@@ -1,30 +1,198 @@
-from huggingface_hub import snapshot_download
+"""Download the checkpoints of the selected models, verified against a manifest.
+
+Only the files a model needs (``ModelSpec.files``) are fetched, several at a
+time, straight into ``--dest``. After a download, a file's size and SHA-256
+are checked against the hub's LFS metadata. They are then recorded, with the
+file's mtime, in ``<dest>/manifest.json``. On later boots a file whose size
+and mtime still match its manifest entry is trusted without hashing it or
+asking the hub, so an up-to-date volume costs one ``stat`` per file.
+``--verify`` re-hashes everything.
+
+Models default to ``SEEDVR_MODELS`` (all registered models if unset):
+
+    SEEDVR_MODELS=3B python download.py
+    python download.py --model 3B 7B --jobs 4
+    python download.py --source /mnt/mirror   # <mirror>/<repo_id>/<file>, e.g. for tests
+"""
+import argparse
+import hashlib
+import json
 import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from model_registry import MODEL_REGISTRY, get_model_spec, selected_models
+
+DEFAULT_DEST = "/workspace/SeedVR/ckpts"
+MANIFEST = "manifest.json"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(16 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class HubSource:
+    """Files from the Hugging Face Hub."""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+
+    def expected(self, repo_id, filenames):
+        """``{filename: (size, sha256)}`` from the hub, sha256 None for non-LFS files."""
+        from huggingface_hub import HfApi
+
+        info = {}
+        for entry in HfApi().get_paths_info(repo_id, list(filenames)):
+            lfs = getattr(entry, "lfs", None)
+            info[entry.path] = (entry.size, lfs.sha256 if lfs is not None else None)
+        return info
+
+    def fetch(self, repo_id, filename, dest):
+        from huggingface_hub import hf_hub_download
+
+        return hf_hub_download(repo_id, filename, local_dir=dest, cache_dir=self.cache_dir)
+
+
+class LocalSource:
+    """A directory laid out like the hub, ``<root>/<repo_id>/<filename>``."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, repo_id, filename):
+        return os.path.join(self.root, repo_id, filename)
+
+    def expected(self, repo_id, filenames):
+        info = {}
+        for filename in filenames:
+            path = self._path(repo_id, filename)
+            if os.path.exists(path):
+                info[filename] = (os.path.getsize(path), file_sha256(path))
+        return info
+
+    def fetch(self, repo_id, filename, dest):
+        target = os.path.join(dest, filename)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(self._path(repo_id, filename), tmp)
+        os.replace(tmp, target)
+        return target
+
+
+class Manifest:
+    def __init__(self, dest):
+        self.path = os.path.join(dest, MANIFEST)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def fresh(self, filename, path):
+        """True if ``path`` is unchanged since it was recorded."""
+        entry = self.entries.get(filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
+    def record(self, filename, path, repo_id, sha256):
+        stat = os.stat(path)
+        with self._lock:
+            self.entries[filename] = {
+                "repo_id": repo_id, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256,
+            }
+            # written after every file so an interrupted boot keeps what it finished
+            tmp = f"{self.path}.{os.getpid()}"
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp, self.path)
+
+
+def _download(source, manifest, repo_id, filename, dest, expected, verify, retries):
+    path = os.path.join(dest, filename)
+    size, sha256 = expected.get(filename, (None, None))
+    if sha256 is None and verify and filename in manifest.entries:
+        sha256 = manifest.entries[filename]["sha256"]
+    # a complete file from an earlier run that has no (valid) manifest entry
+    if os.path.exists(path) and (size is None or os.path.getsize(path) == size):
+        digest = file_sha256(path)
+        if sha256 is None or digest == sha256:
+            manifest.record(filename, path, repo_id, digest)
+            print(f"[download] {filename}: verified existing file")
+            return
+    for attempt in range(retries):
+        start = time.perf_counter()
+        try:
+            source.fetch(repo_id, filename, dest)
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            print(f"[download] {filename}: {e}, retrying")
+            time.sleep(2 ** attempt)
+            continue
+        digest = file_sha256(path)
+        if (size is None or os.path.getsize(path) == size) and (sha256 is None or digest == sha256):
+            manifest.record(filename, path, repo_id, digest)
+            print(f"[download] {filename}: {os.path.getsize(path) / 1024 ** 3:.2f} GB "
+                  f"in {time.perf_counter() - start:.1f}s")
+            return
+        print(f"[download] {filename}: size or sha256 mismatch, downloading again")
+        os.remove(path)
+    raise RuntimeError(f"{repo_id}/{filename} failed verification {retries} times")
+
+
+def download_models(models=None, dest=DEFAULT_DEST, source=None, jobs=4, verify=False, retries=3):
+    """Make sure every file of ``models`` is in ``dest``; returns the manifest entries."""
+    models = models or selected_models()
+    source = source or HubSource(os.path.join(dest, "cache"))
+    os.makedirs(dest, exist_ok=True)
+    manifest = Manifest(dest)
+
+    # files shared between models (the VAE) are fetched once, from the first model listing them
+    wanted = {}
+    for model in models:
+        spec = get_model_spec(model)
+        for filename in spec.files:
+            wanted.setdefault(filename, spec.repo_id)
+    missing = {
+        filename: repo_id for filename, repo_id in wanted.items()
+        if verify or not manifest.fresh(filename, os.path.join(dest, filename))
+    }
+    print(f"[download] {len(wanted) - len(missing)}/{len(wanted)} files up to date for {', '.join(models)}")
+    if not missing:
+        return manifest.entries
+
+    expected = {}
+    for repo_id in sorted(set(missing.values())):
+        expected.update(source.expected(repo_id, [f for f, r in missing.items() if r == repo_id]))
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [
+            pool.submit(_download, source, manifest, repo_id, filename, dest, expected, verify, retries)
+            for filename, repo_id in missing.items()
+        ]
+        for future in futures:
+            future.result()
+    return manifest.entries
+
 
-# Set the save directory
-save_dir = "/workspace/SeedVR/ckpts/"
-cache_dir = save_dir + "/cache"
-
-# Create the directories if they don't exist
-os.makedirs(save_dir, exist_ok=True)
-os.makedirs(cache_dir, exist_ok=True)
-
-# Models to download
-models = [
-    "ByteDance-Seed/SeedVR2-7B",
-    "ByteDance-Seed/SeedVR2-3B"
-]
-
-# Download each model
-for repo_id in models:
-    print(f"Downloading model: {repo_id}")
-    snapshot_download(
-        cache_dir=cache_dir,
-        local_dir=save_dir + repo_id.split('/')[-1],
-        repo_id=repo_id,
-        local_dir_use_symlinks=False,
-        resume_download=True,
-        allow_patterns=["*.json", "*.safetensors", "*.pth", "*.bin", "*.py", "*.md", "*.txt"],
-    )
-
-print("Model downloads complete.")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, nargs="*", choices=sorted(MODEL_REGISTRY), default=None,
+                        help="Models to download (default: SEEDVR_MODELS or all)")
+    parser.add_argument("--dest", type=str, default=DEFAULT_DEST)
+    parser.add_argument("--source", type=str, default=None,
+                        help="Local directory laid out as <source>/<repo_id>/<file> instead of the hub")
+    parser.add_argument("--jobs", type=int, default=4, help="Files downloaded at the same time")
+    parser.add_argument("--verify", action="store_true", help="Re-hash files the manifest lists as up to date")
+    args = parser.parse_args()
+    source = LocalSource(args.source) if args.source else None
+    download_models(args.model, args.dest, source, args.jobs, args.verify)
+    print("Model downloads complete.")
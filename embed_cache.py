@@ -0,0 +1,98 @@
+"""Process-wide cache of text embeddings kept resident on the device.
+
+The default ``pos_emb.pt``/``neg_emb.pt`` embeddings are loaded once per
+process and shared by every batch. Embeddings for other prompts live in a
+store directory keyed by the SHA-256 of the prompt text and are held in an
+LRU cache, so alternative prompts need no file naming convention of their own.
+
+Register an embedding for a prompt with:
+
+    python embed_cache.py register "a prompt" prompt_emb.pt
+"""
+import argparse
+import hashlib
+import os
+from collections import OrderedDict
+
+import torch
+
+DEFAULT_STORE = "./embeds"
+
+
+def prompt_key(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, device, store_dir=DEFAULT_STORE, max_prompts=8):
+        self.device = device
+        self.store_dir = store_dir
+        self.max_prompts = max_prompts
+        self._files = {}
+        self._prompts = OrderedDict()
+
+    def load(self, path):
+        """Load an embedding file once and keep it on the device."""
+        key = os.path.abspath(path)
+        if key not in self._files:
+            self._files[key] = torch.load(path, map_location="cpu").to(self.device)
+        return self._files[key]
+
+    def prompt(self, prompt):
+        """Return the stored embedding for ``prompt``, most recently used last."""
+        key = prompt_key(prompt)
+        if key in self._prompts:
+            self._prompts.move_to_end(key)
+            return self._prompts[key]
+        path = os.path.join(self.store_dir, f"{key}.pt")
+        if not os.path.exists(path):
+            raise KeyError(
+                f"No embedding stored for prompt {prompt!r} ({path}); "
+                f"register one with `python embed_cache.py register`"
+            )
+        return self._insert(key, torch.load(path, map_location="cpu"))
+
+    def register(self, prompt, embeds):
+        """Store ``embeds`` for ``prompt`` on disk and in the cache."""
+        key = prompt_key(prompt)
+        os.makedirs(self.store_dir, exist_ok=True)
+        torch.save(embeds.cpu(), os.path.join(self.store_dir, f"{key}.pt"))
+        return self._insert(key, embeds)
+
+    def _insert(self, key, embeds):
+        self._prompts[key] = embeds.to(self.device)
+        self._prompts.move_to_end(key)
+        while len(self._prompts) > self.max_prompts:
+            self._prompts.popitem(last=False)
+        return self._prompts[key]
+
+    def text_embeds(self, positive_prompt=None, negative_prompt=None,
+                    pos_path="pos_emb.pt", neg_path="neg_emb.pt"):
+        """Build the ``texts_pos``/``texts_neg`` kwargs for ``runner.inference``."""
+        pos = self.prompt(positive_prompt) if positive_prompt else self.load(pos_path)
+        neg = self.prompt(negative_prompt) if negative_prompt else self.load(neg_path)
+        return {"texts_pos": [pos], "texts_neg": [neg]}
+
+
+_caches = {}
+
+
+def get_embedding_cache(device, store_dir=DEFAULT_STORE):
+    """Return the cache shared by everything in this process for ``device``."""
+    key = (str(device), os.path.abspath(store_dir))
+    if key not in _caches:
+        _caches[key] = EmbeddingCache(device, store_dir)
+    return _caches[key]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    register = subparsers.add_parser("register", help="Store a precomputed prompt embedding")
+    register.add_argument("prompt", type=str)
+    register.add_argument("embedding", type=str, help="Path to a torch.save'd embedding tensor")
+    register.add_argument("--store_dir", type=str, default=DEFAULT_STORE)
+    args = parser.parse_args()
+    cache = EmbeddingCache("cpu", args.store_dir)
+    cache.register(args.prompt, torch.load(args.embedding, map_location="cpu"))
+    print(f"Registered {args.embedding} as {prompt_key(args.prompt)}")
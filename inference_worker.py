@@ -0,0 +1,88 @@
+"""Long-lived SeedVR inference worker.
+
+Loads one ``seedvr_engine.Engine`` and then serves restoration
+jobs over a local ``multiprocessing.connection`` socket, so the config load,
+DiT checkpoint load and VAE setup are paid once per process instead of once
+per job. With ``"progress": True`` in a job the worker sends progress events
+while it runs and stops early when the client sends ``{"cmd": "cancel"}``.
+Launched by ``worker_pool.py`` with:
+
+    torchrun --nproc-per-node=1 projects/inference_worker.py --model 3B --port 7870
+"""
+import argparse
+import os
+import threading
+import traceback
+from multiprocessing.connection import Listener
+
+from model_registry import MODEL_REGISTRY
+from progress import JobCancelled
+from seedvr_engine import Engine
+
+
+def _forward_progress(conn):
+    """Progress callback sending events to ``conn`` and checking for cancels."""
+    lock = threading.Lock()
+    cancelled = [False]
+
+    def _callback(event):
+        # called from the generation and the writer thread
+        with lock:
+            try:
+                if not cancelled[0] and conn.poll():
+                    cancelled[0] = conn.recv().get("cmd") == "cancel"
+                if not cancelled[0]:
+                    conn.send({"status": "progress", "event": event})
+            except (EOFError, OSError):
+                # nobody is waiting for the result any more
+                cancelled[0] = True
+            if cancelled[0]:
+                raise JobCancelled("job cancelled by the client")
+
+    return _callback
+
+
+def serve(model, port, sp_size, authkey):
+    engine = Engine(model, sp_size)
+    # Only start listening once the runner is ready: a successful connect is
+    # the readiness signal for the pool.
+    with Listener(("127.0.0.1", port), authkey=authkey) as listener:
+        print(f"Inference worker for {model} ready on port {port}", flush=True)
+        while True:
+            with listener.accept() as conn:
+                job = conn.recv()
+                cmd = job.get("cmd", "run")
+                if cmd == "ping":
+                    conn.send({"status": "ok"})
+                    continue
+                if cmd == "shutdown":
+                    conn.send({"status": "ok"})
+                    print(f"Inference worker for {model} shutting down", flush=True)
+                    return
+                params = dict(job["params"])
+                if job.get("progress"):
+                    params["progress"] = _forward_progress(conn)
+                try:
+                    outputs = engine.restore(params.pop("video_path"), params)
+                    reply = {"status": "ok", "outputs": outputs}
+                except JobCancelled:
+                    print("Job cancelled", flush=True)
+                    reply = {"status": "cancelled"}
+                except Exception:
+                    error = traceback.format_exc()
+                    print(error, flush=True)
+                    reply = {"status": "error", "error": error}
+                try:
+                    conn.send(reply)
+                except OSError:
+                    pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, choices=sorted(MODEL_REGISTRY), required=True)
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--sp_size", type=int, default=1)
+    args = parser.parse_args()
+    authkey = bytes.fromhex(os.environ["SEEDVR_WORKER_AUTHKEY"])
+    serve(args.model, args.port, args.sp_size, authkey)
@@ -0,0 +1,176 @@
+"""Admission control and per-job workspaces for the Gradio app.
+
+Every job gets its own ``<root>/<job id>/{input,output}`` directories, so
+concurrent users never see each other's files and a job only restores its
+own upload. Jobs are admitted in submission order when
+
+- fewer than ``max_running`` jobs are running (one per warm worker),
+- no running job uses the same worker, which runs one job at a time, and
+- their estimated device memory fits next to the running jobs in
+  ``capacity_gb``. A job is always admitted when nothing else runs.
+
+Waiting jobs can ask for their queue position and an ETA based on recent job
+durations. Inputs are deleted when a job finishes and whole workspaces
+``ttl`` seconds later.
+"""
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+
+# Weight of the latest job in the per-model duration average.
+DURATION_SMOOTHING = 0.3
+
+
+def device_memory_gb():
+    """Total memory of the first GPU, without creating a CUDA context here."""
+    try:
+        out = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=10, check=True,
+        ).stdout
+        return float(out.splitlines()[0]) / 1024
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return None
+
+
+class Job:
+    def __init__(self, model, resource, memory_gb, workspace):
+        self.id = os.path.basename(workspace)
+        self.model = model
+        self.resource = resource
+        self.memory_gb = memory_gb
+        self.workspace = workspace
+        self.input_dir = os.path.join(workspace, "input")
+        self.output_dir = os.path.join(workspace, "output")
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.admitted = threading.Event()
+
+
+class JobQueue:
+    def __init__(self, root, capacity_gb=None, max_running=1, ttl=3600):
+        self.root = root
+        self.capacity_gb = capacity_gb
+        self.max_running = max_running
+        self.ttl = ttl
+        self._waiting = deque()
+        self._running = []
+        self._finished = []
+        self._durations = {}
+        self._cond = threading.Condition()
+        # Workspaces left by a previous process are never served again.
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root, exist_ok=True)
+        self._cleaner = threading.Thread(target=self._clean_expired, daemon=True)
+        self._cleaner.start()
+
+    def submit(self, model, resource, memory_gb):
+        """Create a workspace for a new job and queue it."""
+        job = Job(model, resource, memory_gb, os.path.join(self.root, uuid.uuid4().hex))
+        os.makedirs(job.input_dir)
+        os.makedirs(job.output_dir)
+        with self._cond:
+            self._waiting.append(job)
+            self._admit()
+        return job
+
+    def _fits(self, job):
+        if not self._running:
+            return True
+        if len(self._running) >= self.max_running:
+            return False
+        if any(running.resource == job.resource for running in self._running):
+            return False
+        used = sum(running.memory_gb for running in self._running)
+        return self.capacity_gb is None or used + job.memory_gb <= self.capacity_gb
+
+    def _admit(self):
+        # Strictly first come, first served, so large jobs are not starved.
+        while self._waiting and self._fits(self._waiting[0]):
+            job = self._waiting.popleft()
+            job.started = time.monotonic()
+            self._running.append(job)
+            job.admitted.set()
+
+    def wait(self, job, timeout=None):
+        """Wait until ``job`` may run; returns False on timeout."""
+        return job.admitted.wait(timeout)
+
+    def position(self, job):
+        """1-based place of ``job`` among the waiting jobs, 0 once admitted."""
+        with self._cond:
+            try:
+                return self._waiting.index(job) + 1
+            except ValueError:
+                return 0
+
+    def _expected(self, model):
+        if model in self._durations:
+            return self._durations[model]
+        if self._durations:
+            return sum(self._durations.values()) / len(self._durations)
+        return None
+
+    def eta(self, job):
+        """Estimated seconds until ``job`` starts, or None without history."""
+        with self._cond:
+            if job not in self._waiting:
+                return 0.0
+            now = time.monotonic()
+            # Replay the queue ahead of the job over max_running slots.
+            slots = []
+            for running in self._running:
+                expected = self._expected(running.model)
+                if expected is None:
+                    return None
+                slots.append(max(0.0, expected - (now - running.started)))
+            slots += [0.0] * max(0, self.max_running - len(slots))
+            for waiting in self._waiting:
+                if waiting is job:
+                    break
+                expected = self._expected(waiting.model)
+                if expected is None:
+                    return None
+                slots.sort()
+                slots[0] += expected
+            return min(slots)
+
+    def finish(self, job):
+        """Release ``job``'s admission (or drop it from the queue) and its input."""
+        with self._cond:
+            if job in self._waiting:
+                self._waiting.remove(job)
+            elif job in self._running:
+                self._running.remove(job)
+                duration = time.monotonic() - job.started
+                previous = self._durations.get(job.model, duration)
+                self._durations[job.model] = (
+                    previous + DURATION_SMOOTHING * (duration - previous)
+                )
+            job.finished = time.monotonic()
+            self._finished.append(job)
+            self._admit()
+        shutil.rmtree(job.input_dir, ignore_errors=True)
+
+    def _clean_expired(self):
+        while True:
+            time.sleep(min(300, max(1, self.ttl / 4)))
+            now = time.monotonic()
+            with self._cond:
+                expired = [job for job in self._finished if now - job.finished > self.ttl]
+                self._finished = [job for job in self._finished if job not in expired]
+            for job in expired:
+                shutil.rmtree(job.workspace, ignore_errors=True)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "waiting": len(self._waiting),
+                "running": len(self._running),
+                "durations": dict(self._durations),
+            }
@@ -0,0 +1,42 @@
+"""Models served by the engine and what they need.
+
+Kept free of torch and SeedVR imports so the Gradio app can use it for
+admission control without loading the inference stack.
+"""
+import os
+from collections import namedtuple
+
+# weights_gb is the approximate device footprint of the DiT and VAE in bf16;
+# headroom_gb the memory kept free for activations when choosing residency.
+# files are what download.py fetches from repo_id into CKPT_DIR.
+ModelSpec = namedtuple(
+    "ModelSpec",
+    ["config", "checkpoint", "res_h", "res_w", "weights_gb", "headroom_gb", "repo_id", "files"],
+)
+
+CKPT_DIR = "./ckpts"
+
+MODEL_REGISTRY = {
+    "3B": ModelSpec(
+        "./configs_3b/main.yaml", "./ckpts/seedvr2_ema_3b.pth", 720, 1280, 7.5, 6.0,
+        "ByteDance-Seed/SeedVR2-3B", ("seedvr2_ema_3b.pth", "ema_vae.pth"),
+    ),
+    "7B": ModelSpec(
+        "./configs_7b/main.yaml", "./ckpts/seedvr2_ema_7b.pth", 720, 1280, 17.0, 6.0,
+        "ByteDance-Seed/SeedVR2-7B", ("seedvr2_ema_7b.pth", "ema_vae.pth"),
+    ),
+}
+
+
+def get_model_spec(model):
+    if model not in MODEL_REGISTRY:
+        raise ValueError(f"Unknown model {model!r}, expected one of {sorted(MODEL_REGISTRY)}")
+    return MODEL_REGISTRY[model]
+
+
+def selected_models():
+    """Models this deployment serves: ``SEEDVR_MODELS`` (e.g. ``3B,7B``), default all."""
+    value = os.environ.get("SEEDVR_MODELS", "").replace(",", " ").split()
+    for model in value:
+        get_model_spec(model)
+    return value or sorted(MODEL_REGISTRY)
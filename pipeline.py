@@ -0,0 +1,115 @@
+"""Background stages that overlap host work with GPU work in generation_loop.
+
+``Prefetcher`` decodes upcoming inputs while the current one is on the GPU and
+``BackgroundWriter`` runs colour fix and encoding behind the next batch. Both
+are bounded so memory use stays predictable; a depth of 0 runs them inline.
+"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class Prefetcher:
+    """
+    Iterate over ``(item, fn(item))`` pairs while a background thread computes
+    up to ``depth`` results ahead. Without ``fn`` the items themselves are
+    prefetched, which is useful for slow generators such as video decoders.
+    Exceptions raised in the background are re-raised in the consumer.
+    """
+
+    def __init__(self, items, fn=None, depth=1):
+        self.items = items
+        self.fn = fn
+        self.depth = depth
+
+    def _produce(self, item):
+        return item if self.fn is None else (item, self.fn(item))
+
+    def __iter__(self):
+        if self.depth <= 0:
+            for item in self.items:
+                yield self._produce(item)
+            return
+
+        results = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+
+        def _worker():
+            try:
+                for item in self.items:
+                    if stop.is_set():
+                        return
+                    results.put((True, self._produce(item)))
+            except BaseException as e:
+                results.put((False, e))
+            results.put((True, _DONE))
+
+        thread = threading.Thread(target=_worker, daemon=True)
+        thread.start()
+        try:
+            while True:
+                ok, value = results.get()
+                if not ok:
+                    raise value
+                if value is _DONE:
+                    return
+                yield value
+        finally:
+            # Unblock the worker if the consumer stops early.
+            stop.set()
+            while thread.is_alive():
+                try:
+                    results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+
+class BackgroundWriter:
+    """
+    Run post-processing tasks in submission order on a single background
+    thread. ``submit`` blocks while ``max_pending`` tasks are queued or
+    running, which bounds the number of finished samples held in memory.
+    """
+
+    def __init__(self, max_pending=2):
+        self.max_pending = max_pending
+        self._executor = None
+        if max_pending > 0:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+            self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = deque()
+
+    def submit(self, fn, *args, **kwargs):
+        if self._executor is None:
+            fn(*args, **kwargs)
+            return
+        self._reap()
+        self._slots.acquire()
+        self._futures.append(self._executor.submit(self._run, fn, args, kwargs))
+
+    def _run(self, fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        finally:
+            self._slots.release()
+
+    def _reap(self):
+        # Surface failures from finished tasks as early as possible.
+        while self._futures and self._futures[0].done():
+            self._futures.popleft().result()
+
+    def drain(self):
+        """Wait for all submitted tasks and re-raise the first failure."""
+        while self._futures:
+            self._futures.popleft().result()
+
+    def close(self):
+        try:
+            self.drain()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
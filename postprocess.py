@@ -0,0 +1,54 @@
+"""Conversion of model output to encoder-ready uint8 frames.
+
+The model output is float ``(T, C, H, W)`` in [-1, 1] on the device. It used
+to be downloaded as float32 and then permuted, clipped, scaled, rounded and
+cast on the host, each step making another full copy. ``to_uint8_frames``
+does the clip, scale, round, cast and permute on the device a chunk at a
+time. Only the uint8 ``(T, H, W, C)`` frames (a quarter of the bytes) are
+copied out, into a reusable pinned host buffer.
+"""
+import math
+
+import torch
+
+
+class FrameBuffer:
+    """
+    A uint8 host buffer reused for every chunk of frames, pinned when the
+    frames come from the GPU. Only one chunk is in flight at a time: a view
+    is valid until the next ``view`` call.
+    """
+
+    def __init__(self):
+        self._storage = None
+
+    def view(self, shape, pin_memory=False):
+        numel = math.prod(shape)
+        storage = self._storage
+        if storage is None or storage.numel() < numel or (pin_memory and not storage.is_pinned()):
+            storage = self._storage = torch.empty(numel, dtype=torch.uint8, pin_memory=pin_memory)
+        return storage[:numel].view(shape)
+
+
+def to_uint8_frames(frames, buffer=None, chunk_size=16):
+    """
+    Convert float ``(T, C, H, W)`` frames in [-1, 1] to uint8 ``(T, H, W, C)``
+    on the host. The arithmetic runs on the frames' device, ``chunk_size``
+    frames at a time. The result is a view of ``buffer`` when given.
+    """
+    if frames.ndim == 3:
+        frames = frames[:, None]
+    length, channels, height, width = frames.shape
+    shape = (length, height, width, channels)
+    if buffer is not None:
+        out = buffer.view(shape, pin_memory=frames.is_cuda)
+    else:
+        out = torch.empty(shape, dtype=torch.uint8, pin_memory=frames.is_cuda)
+    for start in range(0, length, chunk_size):
+        chunk = frames[start:start + chunk_size].clamp(-1, 1).mul_(127.5).add_(127.5).round_()
+        chunk = chunk.to(torch.uint8).permute(0, 2, 3, 1).contiguous()
+        out[start:start + chunk.size(0)].copy_(chunk, non_blocking=True)
+    if frames.is_cuda:
+        # the downloads above are asynchronous
+        torch.cuda.current_stream(frames.device).synchronize()
+    return out
@@ -0,0 +1,86 @@
+"""Fused preprocessing of decoded uint8 frames for generation_loop.
+
+Does what the SeedVR transform chain did (``/255``, ``NaResize(mode="area")``,
+clamp, ``DivisibleCrop((16, 16))``, ``Normalize(0.5, 0.5)`` and
+``Rearrange("t c h w -> c t h w")``) in one pass. That chain made a new
+full-clip tensor at every step. Here frames stay uint8 until they are on the
+device and are converted a chunk at a time, so the only full-clip tensor is
+the preallocated ``(C, T, H, W)`` result:
+
+- the bicubic resize runs on [0, 255] values, since it is linear the
+  ``/255`` can follow it;
+- the centre crop is a slice of the resized chunk;
+- clamp and ``x * 2 / 255 - 1`` are applied in place on the output.
+
+The resize and crop for an input size are worked out once and kept in
+``VideoPreprocessor.plans``.
+"""
+from collections import namedtuple
+
+import torch
+import torch.nn.functional as F
+
+from bucketing import resized_size
+
+PreprocessPlan = namedtuple(
+    "PreprocessPlan", ["resize_h", "resize_w", "top", "left", "crop_h", "crop_w"]
+)
+
+
+class VideoPreprocessor:
+    def __init__(self, res_h, res_w, device, divisible=16, downsample_only=False,
+                 chunk_size=16, pin_memory=True):
+        self.res_h = res_h
+        self.res_w = res_w
+        self.device = torch.device(device)
+        self.divisible = divisible
+        self.downsample_only = downsample_only
+        self.chunk_size = chunk_size
+        # host frames are staged through pinned memory so the copy is asynchronous
+        self.pin_memory = pin_memory and self.device.type == "cuda"
+        self.plans = {}
+
+    def plan(self, height, width):
+        """Resize and crop for ``height`` x ``width`` frames, computed once per size."""
+        key = (height, width)
+        if key not in self.plans:
+            resize_h, resize_w = resized_size(height, width, self.res_h, self.res_w, self.downsample_only)
+            crop_h = resize_h - resize_h % self.divisible
+            crop_w = resize_w - resize_w % self.divisible
+            # same rounding as torchvision's center_crop
+            top = int(round((resize_h - crop_h) / 2.0))
+            left = int(round((resize_w - crop_w) / 2.0))
+            self.plans[key] = PreprocessPlan(resize_h, resize_w, top, left, crop_h, crop_w)
+        return self.plans[key]
+
+    def _upload(self, frames):
+        if frames.device == self.device:
+            return frames
+        if self.pin_memory and frames.device.type == "cpu":
+            return frames.pin_memory().to(self.device, non_blocking=True)
+        return frames.to(self.device)
+
+    def __call__(self, video, buffer_frames=None):
+        """
+        Turn uint8 ``(T, C, H, W)`` frames, on the host or the device, into the
+        normalised float ``(C, T, H', W')`` model input on ``device``. With
+        ``buffer_frames`` the result has room for that many frames and only
+        the first ``T`` are written, so temporal padding needs no copy.
+        """
+        frames, channels, height, width = video.shape
+        plan = self.plan(height, width)
+        out = torch.empty(
+            (channels, max(frames, buffer_frames or 0), plan.crop_h, plan.crop_w),
+            dtype=torch.float32, device=self.device,
+        )
+        for start in range(0, frames, self.chunk_size):
+            chunk = self._upload(video[start:start + self.chunk_size]).float()
+            if (plan.resize_h, plan.resize_w) != (height, width):
+                chunk = F.interpolate(
+                    chunk, size=(plan.resize_h, plan.resize_w),
+                    mode="bicubic", align_corners=False, antialias=True,
+                )
+            chunk = chunk[..., plan.top:plan.top + plan.crop_h, plan.left:plan.left + plan.crop_w]
+            target = out[:, start:start + chunk.size(0)]
+            target.copy_(chunk.transpose(0, 1)).clamp_(0, 255).mul_(2 / 255).sub_(1)
+        return out
@@ -0,0 +1,193 @@
+"""Per-stage profiling of generation_loop and its Prometheus export.
+
+``StageProfiler`` records, for every pipeline stage of every clip, the wall
+time, peak host RSS, peak device memory and bytes moved between host and
+device, one JSON object per line:
+
+    {"stage": "inference", "clip": "a.mp4", "wall_s": 41.2, "peak_rss_bytes": ...,
+     "peak_device_bytes": ..., "bytes": 0, "rank": 0, "time": 1760000000.0}
+
+Peaks are reset when a stage starts while no other stage is running.
+Colour fix and encoding run on the writer thread next to GPU stages, so an
+overlapping stage reports the peak since the last reset. That can
+overestimate, which is the safe side for sizing. Host peaks need
+``/proc/self/clear_refs``; without it they are the process lifetime peak.
+
+``NULL_PROFILER`` has the same interface and does nothing. ``PrometheusMetrics``
+aggregates records in the app and renders them in the Prometheus text
+format.
+"""
+import contextlib
+import json
+import threading
+import time
+from collections import defaultdict
+
+def _status_bytes(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_host_peak():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+class NullProfiler:
+    enabled = False
+
+    def stage(self, name, clip=None, sync=True):
+        # a fresh record per call; callers write into it from several threads
+        return contextlib.nullcontext({})
+
+    def summary(self):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class StageProfiler:
+    enabled = True
+
+    def __init__(self, path, device=None, rank=0):
+        import torch
+
+        self._torch = torch
+        self.path = path
+        self.rank = rank
+        self.device = device
+        self._cuda = device is not None and torch.device(device).type == "cuda"
+        self._lock = threading.Lock()
+        self._active = 0
+        self._totals = defaultdict(lambda: [0, 0.0, 0])
+        self._file = open(path, "a")
+
+    def _reset_peaks(self):
+        _reset_host_peak()
+        if self._cuda:
+            self._torch.cuda.reset_peak_memory_stats(self.device)
+
+    @contextlib.contextmanager
+    def stage(self, name, clip=None, sync=True):
+        """
+        Time the enclosed block as stage ``name`` of ``clip``. The yielded
+        dict is written out with the record, set ``bytes`` in it for the
+        host/device traffic of the stage. ``sync`` waits for queued device
+        work first so the time is not attributed to the next stage.
+        """
+        record = {"stage": name, "clip": clip, "bytes": 0}
+        with self._lock:
+            if self._active == 0:
+                self._reset_peaks()
+            self._active += 1
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            if sync and self._cuda:
+                self._torch.cuda.synchronize(self.device)
+            record["wall_s"] = time.perf_counter() - start
+            record["peak_rss_bytes"] = _status_bytes("VmHWM")
+            record["peak_device_bytes"] = (
+                self._torch.cuda.max_memory_allocated(self.device) if self._cuda else None
+            )
+            record["rank"] = self.rank
+            record["time"] = time.time()
+            with self._lock:
+                self._active -= 1
+                totals = self._totals[name]
+                totals[0] += 1
+                totals[1] += record["wall_s"]
+                totals[2] += record["bytes"]
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
+
+    def summary(self):
+        with self._lock:
+            for name, (count, seconds, moved) in self._totals.items():
+                print(
+                    f"[profile] {name}: {count} calls, {seconds:.2f}s, "
+                    f"{moved / 1024 ** 2:.1f} MB moved"
+                )
+
+    def close(self):
+        self._file.close()
+
+
+def load_records(path):
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+class PrometheusMetrics:
+    """Stage records and app gauges rendered in the Prometheus text format."""
+
+    def __init__(self, prefix="seedvr"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._maxima = {}
+        self._gauges = []
+
+    def add_gauge(self, name, help_text, fn):
+        """Export ``fn()`` (a number, or a dict of label value -> number) as a gauge."""
+        self._gauges.append((name, help_text, fn))
+
+    def inc(self, name, labels=(), value=1.0):
+        with self._lock:
+            self._counters[(name, tuple(labels))] += value
+
+    def observe(self, records, **labels):
+        """Add the stage records of one job."""
+        with self._lock:
+            for record in records:
+                key = tuple(sorted(dict(labels, stage=record["stage"]).items()))
+                self._counters[("stage_seconds_total", key)] += record["wall_s"]
+                self._counters[("stage_calls_total", key)] += 1
+                self._counters[("stage_transfer_bytes_total", key)] += record.get("bytes") or 0
+                for field in ("peak_rss_bytes", "peak_device_bytes"):
+                    if record.get(field) is not None:
+                        metric = ("stage_" + field, key)
+                        self._maxima[metric] = max(self._maxima.get(metric, 0), record[field])
+
+    def _line(self, name, labels, value):
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        return f"{self.prefix}_{name}{{{label_text}}} {value}" if label_text else f"{self.prefix}_{name} {value}"
+
+    def render(self):
+        series = defaultdict(list)
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                series[(name, "counter")].append((labels, value))
+            for (name, labels), value in self._maxima.items():
+                series[(name, "gauge")].append((labels, value))
+        for name, help_text, fn in self._gauges:
+            value = fn()
+            items = value.items() if isinstance(value, dict) else [(None, value)]
+            series[(name, "gauge")] += [
+                ((("key", label),) if label is not None else (), item) for label, item in items
+            ]
+        lines = []
+        helps = {name: help_text for name, help_text, _ in self._gauges}
+        for (name, kind), samples in sorted(series.items()):
+            if name in helps:
+                lines.append(f"# HELP {self.prefix}_{name} {helps[name]}")
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+            lines += [self._line(name, labels, value) for labels, value in sorted(samples)]
+        return "\n".join(lines) + "\n"
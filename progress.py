@@ -0,0 +1,61 @@
+"""Structured progress events from generation_loop.
+
+``generation_loop(..., progress=callback)`` calls ``callback(event)`` with a
+dict for every milestone:
+
+- ``{"stage": "decode", "input": name, "frames": n}``
+- ``{"stage": "vae_encode", "inputs": [...], "frames": [...]}``
+- ``{"stage": "dit", "step": k, "steps": n}``
+- ``{"stage": "vae_decode", "inputs": [...]}``
+- ``{"stage": "color_fix" | "encode", "input": name, "frames": done, "total": n}``
+- ``{"stage": "preview", "input": name, "path": jpeg or image, "frames": [start, end]}``
+- ``{"stage": "written", "input": name, "path": output}``
+
+The callback runs on the generation thread or on the background writer
+thread. It may raise ``JobCancelled`` to abort the job. Without a callback
+nothing is recorded and no hooks are installed.
+"""
+import contextlib
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class ProgressReporter:
+    def __init__(self, callback=None):
+        self.callback = callback
+
+    @property
+    def enabled(self):
+        return self.callback is not None
+
+    def __call__(self, stage, **fields):
+        if self.callback is not None:
+            self.callback(dict(stage=stage, **fields))
+
+    @contextlib.contextmanager
+    def track_dit(self, dit, steps, calls_per_step=1, inputs=()):
+        """
+        Report sampling steps by counting forward calls of ``dit``, which
+        ``runner.inference`` makes ``calls_per_step`` times per step. The VAE
+        decode follows the last step.
+        """
+        if self.callback is None:
+            yield
+            return
+        calls = [0]
+
+        def _hook(module, args, output):
+            calls[0] += 1
+            if calls[0] % calls_per_step == 0 and calls[0] <= steps * calls_per_step:
+                step = calls[0] // calls_per_step
+                self("dit", step=step, steps=steps)
+                if step == steps:
+                    self("vae_decode", inputs=list(inputs))
+
+        handle = dit.register_forward_hook(_hook)
+        try:
+            yield
+        finally:
+            handle.remove()
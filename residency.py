@@ -0,0 +1,162 @@
+"""Decides where the DiT and VAE live between pipeline stages.
+
+At startup the free device memory is compared with the model sizes and one of
+three policies is picked:
+
+- ``resident``: both models stay on the device, nothing is moved.
+- ``swap``: a model is moved in when a stage needs it, and the other one is
+  moved out only if the free memory would otherwise be too small.
+- ``offload``: like ``swap``, but weights keep a pinned host copy. Moving a
+  model out just drops the device tensors and moving it in is a non-blocking
+  copy from pinned memory.
+
+The manager is the only thing that moves the models. The engine activates
+the VAE before decoding, which moves the DiT out if the policy needs it, and
+calls ``runner.inference`` with ``dit_offload=False``.
+"""
+import os
+import time
+
+import torch
+
+POLICIES = ("auto", "resident", "swap", "offload")
+
+GB = 1024 ** 3
+
+
+def module_bytes(module):
+    return sum(t.numel() * t.element_size() for t in (*module.parameters(), *module.buffers()))
+
+
+def available_host_bytes():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def _tensor_slots(module):
+    # Parameters keep their identity across Module.to(), buffers do not, so
+    # both are addressed through the submodule that owns them.
+    for submodule in module.modules():
+        for name, param in submodule._parameters.items():
+            if param is not None:
+                yield submodule, "param", name
+        for name, buf in submodule._buffers.items():
+            if buf is not None:
+                yield submodule, "buffer", name
+
+
+class ResidencyManager:
+    def __init__(self, modules, device, policy="auto", headroom_gb=6.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown residency policy: {policy}")
+        self.modules = modules
+        self.device = torch.device(device)
+        self.headroom = int(headroom_gb * GB)
+        self.sizes = {name: module_bytes(module) for name, module in modules.items()}
+        self._host = {}
+        self._moved_bytes = 0
+        self._moved_seconds = 0.0
+        self.policy = self._choose(policy) if policy == "auto" else policy
+        if self.device.type != "cuda":
+            self.policy = "resident"
+        sizes = ", ".join(f"{name} {size / GB:.2f} GB" for name, size in self.sizes.items())
+        print(f"[residency] policy={self.policy} ({sizes}, headroom {headroom_gb:.1f} GB)")
+
+        if self.policy == "resident":
+            for name in self.modules:
+                self._load(name)
+        elif self.policy == "offload":
+            for name, module in self.modules.items():
+                for submodule, kind, key in _tensor_slots(module):
+                    tensor = getattr(submodule, key)
+                    self._host[(id(submodule), key)] = tensor.detach().to("cpu").pin_memory()
+                self._offload(name)
+        self.report("startup")
+
+    def _choose(self, policy):
+        if self.device.type != "cuda":
+            return "resident"
+        free, _ = torch.cuda.mem_get_info(self.device)
+        # Memory held by models already on the device is available to them.
+        available = free + sum(
+            self.sizes[name] for name, module in self.modules.items() if self._on_device(module)
+        )
+        print(f"[residency] {available / GB:.2f} GB usable device memory")
+        if available >= sum(self.sizes.values()) + self.headroom:
+            return "resident"
+        if available_host_bytes() >= 2 * sum(self.sizes.values()):
+            return "offload"
+        return "swap"
+
+    def _on_device(self, module):
+        tensor = next(module.parameters(), None)
+        return tensor is not None and tensor.device.type == self.device.type
+
+    def activate(self, name):
+        """Make sure ``name`` is on the device, evicting others only if needed."""
+        if self._on_device(self.modules[name]):
+            return
+        if self.policy != "resident":
+            needed = self.sizes[name] + self.headroom
+            for other, module in self.modules.items():
+                if other == name or not self._on_device(module):
+                    continue
+                free, _ = torch.cuda.mem_get_info(self.device)
+                if free >= needed:
+                    break
+                self._offload(other)
+        self._load(name)
+
+    def _load(self, name):
+        module = self.modules[name]
+        if self._on_device(module):
+            return
+        start = time.perf_counter()
+        if self._host:
+            for submodule, kind, key in _tensor_slots(module):
+                tensor = self._host[(id(submodule), key)].to(self.device, non_blocking=True)
+                if kind == "param":
+                    submodule._parameters[key].data = tensor
+                else:
+                    submodule._buffers[key] = tensor
+        else:
+            module.to(self.device)
+        self._account(start, name)
+
+    def _offload(self, name):
+        module = self.modules[name]
+        start = time.perf_counter()
+        if self._host:
+            # Weights never change during inference, so the pinned copy is
+            # still current and nothing has to be copied back.
+            for submodule, kind, key in _tensor_slots(module):
+                tensor = self._host[(id(submodule), key)]
+                if kind == "param":
+                    submodule._parameters[key].data = tensor
+                else:
+                    submodule._buffers[key] = tensor
+            self._moved_seconds += time.perf_counter() - start
+        else:
+            module.to("cpu")
+            self._account(start, name)
+
+    def _account(self, start, name):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+        self._moved_seconds += time.perf_counter() - start
+        self._moved_bytes += self.sizes[name]
+
+    def report(self, label="batch"):
+        """Log and reset the transfer statistics since the last report."""
+        print(
+            f"[residency] {label}: policy={self.policy}, moved "
+            f"{self._moved_bytes / GB:.2f} GB in {self._moved_seconds:.3f}s"
+        )
+        self._moved_bytes = 0
+        self._moved_seconds = 0.0
@@ -0,0 +1,147 @@
+"""Disk-backed cache of restoration results, keyed by input content.
+
+The key is the SHA-256 of the input file's bytes together with every
+generation parameter, so resubmitting the same clip with the same settings
+returns the stored output instead of running the model again. Seeds are set
+with ``same_across_ranks=True``, which makes repeated runs reproducible
+enough for this. Entries are evicted least recently used first once the
+cache grows beyond ``max_bytes``.
+
+Paths handed out by ``get`` and ``put`` are hard links under ``.serve``, so
+an entry evicted by a later job does not pull the file from under a
+response still being sent. Served links are removed after ``SERVE_TTL``.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Bump when a change to the pipeline makes stored outputs stale.
+CACHE_VERSION = 1
+
+# Seconds a served link outlives its response.
+SERVE_TTL = 3600
+
+
+def _dir_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+class ResultCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._serve_dir = os.path.join(root, ".serve")
+        os.makedirs(root, exist_ok=True)
+        # Rebuild the LRU order from the last access times on disk.
+        entries = []
+        for key in os.listdir(root):
+            path = os.path.join(root, key)
+            if key.startswith("."):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.isdir(path):
+                entries.append((os.path.getmtime(path), key, _dir_bytes(path)))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+        self._evict()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def key(self, input_path, params):
+        """Cache key of ``input_path`` restored with ``params``."""
+        digest = hashlib.sha256()
+        with open(input_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(json.dumps(
+            {"version": CACHE_VERSION, "params": params}, sort_keys=True, default=str
+        ).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Path of the stored output for ``key``, or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            entry = os.path.join(self.root, key)
+            files = os.listdir(entry) if os.path.isdir(entry) else []
+            if not files:
+                # removed behind our back
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            os.utime(entry)
+            self.hits += 1
+            return self._serve(os.path.join(entry, files[0]))
+
+    def put(self, key, output_path):
+        """Store a copy of ``output_path`` under ``key`` and return its path."""
+        if not self.enabled:
+            return output_path
+        size = os.path.getsize(output_path)
+        if size > self.max_bytes:
+            return output_path
+        entry = os.path.join(self.root, key)
+        # Copy into a hidden directory first so readers never see a partial entry.
+        staging = os.path.join(self.root, f".{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        shutil.copy(output_path, os.path.join(staging, os.path.basename(output_path)))
+        with self._lock:
+            if key in self._entries:
+                shutil.rmtree(staging, ignore_errors=True)
+            else:
+                os.rename(staging, entry)
+                self._entries[key] = size
+            self._entries.move_to_end(key)
+            served = self._serve(os.path.join(entry, os.listdir(entry)[0]))
+            self._evict()
+        return served
+
+    def _serve(self, path):
+        # called with the lock held, so the entry cannot be evicted meanwhile
+        now = time.time()
+        if os.path.isdir(self._serve_dir):
+            for name in os.listdir(self._serve_dir):
+                served = os.path.join(self._serve_dir, name)
+                if now - os.path.getmtime(served) > SERVE_TTL:
+                    shutil.rmtree(served, ignore_errors=True)
+        target_dir = os.path.join(self._serve_dir, uuid.uuid4().hex)
+        os.makedirs(target_dir)
+        target = os.path.join(target_dir, os.path.basename(path))
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy(path, target)
+        return target
+
+    def _evict(self):
+        while self._entries and sum(self._entries.values()) > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            print(f"[result cache] evicted {key}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": sum(self._entries.values()),
+                "max_bytes": self.max_bytes,
+            }
@@ -47,12 +47,34 @@ cp /app/color_fix.py ./projects/video_diffusion_sr/color_fix.py
 echo "Copying modified inference scripts..."
 cp /app/inference_seedvr2_3b_modified.py /workspace/SeedVR/projects/inference_seedvr2_3b.py
 cp /app/inference_seedvr2_7b_modified.py /workspace/SeedVR/projects/inference_seedvr2_7b.py
+cp /app/bucketing.py /workspace/SeedVR/projects/bucketing.py
+cp /app/checkpoint_cache.py /workspace/SeedVR/projects/checkpoint_cache.py
+cp /app/dedup.py /workspace/SeedVR/projects/dedup.py
+cp /app/embed_cache.py /workspace/SeedVR/projects/embed_cache.py
+cp /app/inference_worker.py /workspace/SeedVR/projects/inference_worker.py
+cp /app/model_registry.py /workspace/SeedVR/projects/model_registry.py
+cp /app/pipeline.py /workspace/SeedVR/projects/pipeline.py
+cp /app/postprocess.py /workspace/SeedVR/projects/postprocess.py
+cp /app/preprocess.py /workspace/SeedVR/projects/preprocess.py
+cp /app/profiling.py /workspace/SeedVR/projects/profiling.py
+cp /app/progress.py /workspace/SeedVR/projects/progress.py
+cp /app/residency.py /workspace/SeedVR/projects/residency.py
+cp /app/scene_detect.py /workspace/SeedVR/projects/scene_detect.py
+cp /app/scheduling.py /workspace/SeedVR/projects/scheduling.py
+cp /app/seedvr_engine.py /workspace/SeedVR/projects/seedvr_engine.py
+cp /app/temporal_padding.py /workspace/SeedVR/projects/temporal_padding.py
+cp /app/temporal_tiling.py /workspace/SeedVR/projects/temporal_tiling.py
+cp /app/video_io.py /workspace/SeedVR/projects/video_io.py
 
 # 10. Download models
 echo "Downloading models..."
 python /app/download.py
 
-# 11. Launch Gradio app
+# 11. Convert checkpoints to safetensors for memory-mapped loading
+echo "Converting checkpoints..."
+python /app/checkpoint_cache.py convert
+
+# 12. Launch Gradio app
 echo "Launching Gradio app..."
 export PYTHONUNBUFFERED=1
 python /app/app.py
\ No newline at end of file
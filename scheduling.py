@@ -0,0 +1,82 @@
+"""Cost-aware distribution of inputs across data-parallel ranks.
+
+Inputs are weighted by frame count x resolution after the input transform,
+taken from container metadata, and assigned with the longest-processing-time
+(LPT) greedy rule so ranks finish at about the same time. Optionally a shared
+on-disk work queue lets ranks that run out of work take inputs that their
+owners have not started yet.
+"""
+import hashlib
+import heapq
+import os
+import socket
+
+
+def estimate_costs(names, keys):
+    """Relative cost of each input; inputs without a key get the mean cost."""
+    known = [key.frames * key.height * key.width for key in keys.values() if key is not None]
+    fallback = sum(known) / len(known) if known else 1
+    return [
+        keys[name].frames * keys[name].height * keys[name].width
+        if keys.get(name) is not None else fallback
+        for name in names
+    ]
+
+
+def partition_lpt(items, costs, groups):
+    """
+    Assign ``items`` to ``groups`` lists: most expensive first, each to the
+    currently least loaded group. Every group lists its items in descending
+    cost, and the result is deterministic so all ranks agree on it.
+    """
+    order = sorted(range(len(items)), key=lambda i: (-costs[i], i))
+    loads = [(0, group) for group in range(groups)]
+    partitions = [[] for _ in range(groups)]
+    for i in order:
+        load, group = heapq.heappop(loads)
+        partitions[group].append(items[i])
+        heapq.heappush(loads, (load + costs[i], group))
+    return partitions
+
+
+class WorkQueue:
+    """
+    A directory of claim files shared by all ranks. Whoever creates the claim
+    for an input first processes it. Claims are per input, so ranks that cut
+    the inputs into batches differently still never restore one twice.
+    Claims live in ``<root>/<run_id>``; all ranks of one run pass the same
+    ``run_id`` and every run uses a new one.
+    """
+
+    def __init__(self, root, run_id):
+        self.root = os.path.join(root, run_id)
+        os.makedirs(self.root, exist_ok=True)
+
+    def claim(self, name):
+        key = hashlib.sha1(name.encode("utf-8")).hexdigest()
+        try:
+            fd = os.open(os.path.join(self.root, f"{key}.claim"), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{socket.gethostname()} {os.getpid()}\n")
+        return True
+
+    def iter_batches(self, own, others):
+        """
+        Yield this rank's batches first, then steal from the other ranks,
+        taking from the tail of their lists where their owners will be last.
+        Inputs already claimed elsewhere are dropped from the batches.
+        """
+        for batch in own:
+            claimed = [name for name in batch if self.claim(name)]
+            if claimed:
+                yield claimed
+        tails = [list(reversed(batches)) for batches in others]
+        while any(tails):
+            for tail in tails:
+                if tail:
+                    claimed = [name for name in tail.pop(0) if self.claim(name)]
+                    if claimed:
+                        print(f"Took over {claimed}")
+                        yield claimed
@@ -0,0 +1,812 @@
+# // Copyright (c) 2025 Bytedance Ltd. and/or its affiliates
+# //
+# // Licensed under the Apache License, Version 2.0 (the "License");
+# // you may not use this file except in compliance with the License.
+# // You may obtain a copy of the License at
+# //
+# //     http://www.apache.org/licenses/LICENSE-2.0
+# //
+# // Unless required by applicable law or agreed to in writing, software
+# // distributed under the License is distributed on an "AS IS" BASIS,
+# // WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# // See the License for the specific language governing permissions and
+# // limitations under the License.
+
+"""SeedVR2 restoration engine shared by every model size.
+
+Imports that are only needed once work starts (the model stack, image IO,
+transforms) are deferred so a fresh worker reaches weight loading sooner,
+and DiT weights come from a memory-mapped safetensors conversion cache.
+
+Models are described once in ``model_registry.MODEL_REGISTRY``. A
+long-lived process keeps an ``Engine`` per model and calls
+``Engine.restore``; the module-level ``restore`` does the same with a
+per-process engine cache. From the command line (run from the SeedVR
+checkout, like the original scripts):
+
+    torchrun --nproc-per-node=1 projects/seedvr_engine.py --model 7B --video_path ./test_videos
+"""
+import os
+import torch
+from einops import rearrange
+from omegaconf import OmegaConf
+import datetime
+import gc
+import json
+import shutil
+import uuid
+
+
+if os.path.exists("./projects/video_diffusion_sr/color_fix.py"):
+    from projects.video_diffusion_sr.color_fix import (
+        ADAIN_STATS, COLOR_FIX_MODES, AdaINStream, adain_params, apply_affine, color_transfer,
+    )
+    use_colorfix=True
+else:
+    use_colorfix = False
+    COLOR_FIX_MODES = ("none",)
+    ADAIN_STATS = ("ema",)
+    print('Note!!!!!! Color fix is not avaliable!')
+import argparse
+
+
+from common.distributed import (
+    barrier_if_distributed,
+    get_device as get_rank_device,
+    get_global_rank,
+    init_torch,
+)
+
+from common.distributed.advanced import (
+    get_data_parallel_rank,
+    get_data_parallel_world_size,
+    get_sequence_parallel_rank,
+    get_sequence_parallel_world_size,
+    init_sequence_parallel,
+)
+
+from common.config import load_config
+from common.distributed.ops import sync_data
+from common.seed import set_seed
+from bucketing import bucket_inputs, probe_keys
+from checkpoint_cache import DEFAULT_CACHE_DIR, load_state_dict, prewarm
+from dedup import collapse_static_runs, compute_saved
+from embed_cache import get_embedding_cache
+from model_registry import MODEL_REGISTRY, get_model_spec
+from pipeline import BackgroundWriter, Prefetcher
+from postprocess import FrameBuffer, to_uint8_frames
+from preprocess import VideoPreprocessor
+from profiling import NULL_PROFILER, StageProfiler
+from progress import ProgressReporter
+from residency import POLICIES as RESIDENCY_POLICIES, ResidencyManager
+from scene_detect import split_scenes
+from scheduling import WorkQueue, estimate_costs, partition_lpt
+from temporal_padding import PADDING_MODES, TemporalPadding
+from temporal_tiling import BLEND_MODES, TemporalBlender, valid_window_length
+from video_io import VideoWriter, concat_videos, iter_video_windows, probe_video, read_video_to_device
+
+
+def get_device():
+    """This rank's CUDA device, or the CPU when CUDA is unavailable (benchmarks)."""
+    return get_rank_device() if torch.cuda.is_available() else torch.device("cpu")
+
+def configure_sequence_parallel(sp_size):
+    if sp_size > 1:
+        init_sequence_parallel(sp_size)
+
+def is_image_file(filename):
+    image_exts = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
+    return os.path.splitext(filename.lower())[1] in image_exts
+
+def _configure_dit_from_state(runner, state):
+    """
+    ``runner.configure_dit_model(device="cuda", checkpoint=...)`` with an
+    already loaded state dict: the DiT is built on the meta device, takes
+    over the memory-mapped host tensors with ``assign=True`` and is then
+    moved to the device, so the weights are on the device only once.
+    """
+    from common.config import create_object
+    from common.distributed.meta_init_utils import meta_non_persistent_buffer_init_fn
+
+    with torch.device("meta"):
+        runner.dit = create_object(runner.config.dit.model)
+    runner.dit.set_gradient_checkpointing(runner.config.dit.gradient_checkpoint)
+    loading_info = runner.dit.load_state_dict(state, strict=True, assign=True)
+    print(f"Loading info: {loading_info}")
+    runner.dit = meta_non_persistent_buffer_init_fn(runner.dit)
+    runner.dit.to(get_device())
+
+def configure_runner(model, sp_size=1, residency="auto", residency_headroom_gb=None,
+                     checkpoint_cache_dir=DEFAULT_CACHE_DIR):
+    spec = get_model_spec(model)
+    if checkpoint_cache_dir:
+        # read the weights into the page cache while the model stack is set up
+        prewarm(spec.checkpoint, checkpoint_cache_dir)
+    # imported here so that stub runners (benchmark.py) do not need the model stack
+    from projects.video_diffusion_sr.infer import VideoDiffusionInfer
+
+    config = load_config(spec.config)
+    runner = VideoDiffusionInfer(config)
+    OmegaConf.set_readonly(runner.config, False)
+    
+    init_torch(cudnn_benchmark=False, timeout=datetime.timedelta(seconds=3600))
+    configure_sequence_parallel(sp_size)
+    if checkpoint_cache_dir:
+        _configure_dit_from_state(runner, load_state_dict(spec.checkpoint, "cpu", checkpoint_cache_dir))
+    else:
+        runner.configure_dit_model(device="cuda", checkpoint=spec.checkpoint)
+    runner.configure_vae_model()
+    # Set memory limit.
+    if hasattr(runner.vae, "set_memory_limit"):
+        runner.vae.set_memory_limit(**runner.config.vae.memory_limit)
+    # Decide once whether the DiT and VAE can both stay on the device.
+    runner.residency = ResidencyManager(
+        {"dit": runner.dit, "vae": runner.vae},
+        get_device(),
+        policy=residency,
+        headroom_gb=spec.headroom_gb if residency_headroom_gb is None else residency_headroom_gb,
+    )
+    # Decoding activates the VAE through the manager, so the DiT leaves the
+    # device through its pinned buffers and is counted in the transfer stats.
+    vae_decode = runner.vae_decode
+
+    def _vae_decode(*args, **kwargs):
+        runner.residency.activate("vae")
+        return vae_decode(*args, **kwargs)
+
+    runner.vae_decode = _vae_decode
+    runner.model = model
+    return runner
+
+def generation_step(runner, text_embeds_dict, cond_latents, dit_offload=True):
+    def _move_to_cuda(x):
+        return [i.to(get_device()) for i in x]
+
+    noises = [torch.randn_like(latent) for latent in cond_latents]
+    aug_noises = [torch.randn_like(latent) for latent in cond_latents]
+    print(f"Generating with noise shape: {noises[0].size()}.")
+    if get_sequence_parallel_world_size() > 1:
+        noises, aug_noises, cond_latents = sync_data((noises, aug_noises, cond_latents), 0)
+    noises, aug_noises, cond_latents = list(
+        map(lambda x: _move_to_cuda(x), (noises, aug_noises, cond_latents))
+    )
+    cond_noise_scale = 0.0
+
+    def _add_noise(x, aug_noise):
+        t = (
+            torch.tensor([1000.0], device=get_device())
+            * cond_noise_scale
+        )
+        shape = torch.tensor(x.shape[1:], device=get_device())[None]
+        t = runner.timestep_transform(t, shape)
+        print(
+            f"Timestep shifting from"
+            f" {1000.0 * cond_noise_scale} to {t}."
+        )
+        x = runner.schedule.forward(x, aug_noise, t)
+        return x
+
+    conditions = [
+        runner.get_condition(
+            noise,
+            task="sr",
+            latent_blur=_add_noise(latent_blur, aug_noise),
+        )
+        for noise, aug_noise, latent_blur in zip(noises, aug_noises, cond_latents)
+    ]
+
+    with torch.no_grad(), torch.autocast(get_device().type, torch.bfloat16, enabled=True):
+        video_tensors = runner.inference(
+            noises=noises,
+            conditions=conditions,
+            dit_offload=dit_offload,
+            **text_embeds_dict,
+        )
+
+    samples = [
+        (
+            rearrange(video[:, None], "c t h w -> t c h w")
+            if video.ndim == 3
+            else rearrange(video, "c t h w -> t c h w")
+        )
+        for video in video_tensors
+    ]
+    del video_tensors
+
+    return samples
+
+def _list_inputs(video_path):
+    """Split a directory, a single file or a list of files into (root, names)."""
+    if isinstance(video_path, (list, tuple)):
+        return "", list(video_path)
+    if os.path.isfile(video_path):
+        return os.path.dirname(video_path), [os.path.basename(video_path)]
+    return video_path, os.listdir(video_path)
+
+def generation_loop(runner, video_path='./test_videos', output_dir='./results', batch_size=0, cfg_scale=1.0, cfg_rescale=0.0, sample_steps=1, seed=666, res_h=None, res_w=None, sp_size=1, out_fps=None, decode_window=None, temporal_window=None, temporal_overlap=8, temporal_blend="linear", video_codec="libx264", video_crf=18, video_preset="medium", copy_audio=True, write_chunk=16, prefetch=1, write_queue=2, positive_prompt=None, negative_prompt=None, memory_budget_gb=None, max_batch_size=16, work_queue=None, color_fix="wavelet", adain_stats="ema", temporal_padding="replicate", scene_split=False, scene_threshold=0.35, scene_min_frames=16, dedup_threshold=None, dedup_min_run=4, progress=None, profile=None):
+
+    def _build_pos_and_neg_prompt():
+        # read positive prompt
+        positive_text = "Cinematic, High Contrast, highly detailed, taken using a Canon EOS R camera, \n        hyper detailed photo - realistic maximum detail, 32k, Color Grading, ultra HD, extreme meticulous detailing, \n        skin pore detailing, hyper sharpness, perfect without deformations."
+        # read negative prompt
+        negative_text = "painting, oil painting, illustration, drawing, art, sketch, oil painting, cartoon, \n        CG Style, 3D render, unreal engine, blurring, dirty, messy, worst quality, low quality, frames, watermark, \n        signature, jpeg artifacts, deformed, lowres, over-smooth"
+        return positive_text, negative_text
+
+    def _build_test_prompts(video_list):
+        positive_text, negative_text = _build_pos_and_neg_prompt()
+        original_videos = []
+        prompts = {}
+        for f in video_list:
+            # if f.endswith(".mp4"):
+            original_videos.append(f)
+            prompts[f] = positive_text
+        print(f"Total prompts to be generated: {len(original_videos)}")
+        return original_videos, prompts, negative_text
+
+    def _preprocess(video):
+        # the buffer is allocated at the padded length and padded in place
+        length = video.size(0)
+        buffer = preprocess(video, padding.buffer_length(length))
+        return padding.fill_(buffer, length)
+
+    def _encode(cond_latents, names):
+        residency.activate("vae")
+        print(f"Encoding videos: {list(map(lambda x: x.size(), cond_latents))}")
+        reporter("vae_encode", inputs=names, frames=[x.size(1) for x in cond_latents])
+        with profiler.stage("vae_encode", ",".join(names)) as record:
+            record["frames"] = sum(x.size(1) for x in cond_latents)
+            cond_latents = runner.vae_encode(cond_latents)
+        residency.activate("dit")
+        return cond_latents
+
+    def _generate(text_embeds, cond_latents, names):
+        # runner.inference calls the DiT twice per step when guidance is on
+        calls_per_step = 1 if runner.config.diffusion.cfg.scale == 1.0 else 2
+        steps = runner.config.diffusion.timesteps.sampling.steps
+        with reporter.track_dit(runner.dit, steps, calls_per_step, names), \
+                profiler.stage("inference", ",".join(names)) as record:
+            # latents are (t, h, w, c); the VAE decode expands t by 4
+            record["frames"] = sum(4 * (x.size(0) - 1) + 1 for x in cond_latents)
+            # runner.inference takes one embedding per latent, and a batch
+            # (or the two pieces of a trimmed clip) shares the same prompt
+            text_embeds = {key: embeds[:1] * len(cond_latents) for key, embeds in text_embeds.items()}
+            return generation_step(
+                runner, text_embeds, cond_latents=cond_latents, dit_offload=False
+            )
+
+    def _use_adain():
+        return use_colorfix and color_fix == "adain"
+
+    def _postprocess(sample, input, name=None, adain=None):
+        with profiler.stage("color_fix", name, sync=False) as record:
+            record["frames"] = sample.size(0)
+            if sample.is_cuda:
+                record["bytes"] = sample.numel()
+            # color fix, on the device in chunks when one is available
+            if adain is not None:
+                # AdaIN scale and shift measured over the whole video
+                sample = apply_affine(sample, *adain, device=get_device())
+            elif use_colorfix and color_fix != "none":
+                sample = color_transfer(
+                    sample, input[: sample.size(0)], mode=color_fix, adain_stats=adain_stats, device=get_device()
+                )
+            # only uint8 (T, H, W, C) frames leave the device
+            return to_uint8_frames(sample, frame_buffer)
+
+    def _open_writer(filename, source, fps):
+        return VideoWriter(
+            filename,
+            fps,
+            codec=video_codec,
+            crf=video_crf,
+            preset=video_preset,
+            # scene files have no audio, it is copied when they are joined
+            audio_source=source if copy_audio and source not in scene_files else None,
+        )
+
+    def _write_frames(writer, sample, input, name=None, done=0, total=None, preview=None, repeats=None,
+                      adain=None):
+        reporter("color_fix", input=name, frames=done, total=total)
+        frames = _postprocess(sample, input, name, adain)
+        if repeats is not None:
+            # frames restored once for a run of duplicates fill the whole run
+            frames = frames.repeat_interleave(repeats, dim=0)
+        with profiler.stage("encode", name, sync=False) as record:
+            record["frames"] = frames.size(0)
+            writer.write(frames)
+        done += frames.size(0)
+        reporter("encode", input=name, frames=done, total=total)
+        if preview is not None:
+            # the last frame of a finished segment, for live previews
+            import mediapy
+
+            mediapy.write_image(preview, frames[-1].numpy())
+            reporter("preview", input=name, path=preview, frames=[done - frames.size(0), done - 1])
+        return done
+
+    def _write_video(filename, source, fps, sample, input, repeats=None):
+        # colour fix, convert and encode a few frames at a time
+        name = os.path.basename(source)
+        total = sample.size(0) if repeats is None else int(repeats.sum())
+        done = 0
+        adain = None
+        if _use_adain():
+            # statistics over the whole clip, not per write chunk
+            adain = adain_params(sample, input[: sample.size(0)], stats=adain_stats, device=get_device())
+        with _open_writer(filename, source, fps) as writer:
+            for t in range(0, sample.size(0), write_chunk):
+                done = _write_frames(
+                    writer, sample[t:t + write_chunk], input[t:t + write_chunk],
+                    name=name, done=done, total=total,
+                    repeats=None if repeats is None else repeats[t:t + write_chunk],
+                    adain=None if adain is None else [params[t:t + write_chunk] for params in adain],
+                )
+        reporter("written", input=name, path=filename)
+
+    def _write_image(filename, sample, input):
+        import mediapy
+
+        name = os.path.basename(filename)
+        reporter("color_fix", input=name, frames=0, total=1)
+        sample = _postprocess(sample, input, name).numpy()
+        with profiler.stage("encode", name, sync=False) as record:
+            record["frames"] = 1
+            mediapy.write_image(filename, sample.squeeze(0))
+        reporter("preview", input=name, path=filename, frames=[0, 0])
+        reporter("written", input=name, path=filename)
+
+    def _close_tiled(writer, name, filename):
+        writer.close()
+        reporter("written", input=name, path=filename)
+
+    def _split_scenes(root, names):
+        # The main process cuts every video into scene files, which then go
+        # through scheduling and restoration as inputs of their own.
+        plan_path = os.path.join(scene_dir, "plan.json")
+        if get_global_rank() == 0:
+            plan = {}
+            for name in names:
+                source = os.path.join(root, name)
+                scenes = [] if is_image_file(name) else split_scenes(
+                    source, scene_dir, scene_threshold, scene_min_frames
+                )
+                plan[source] = [scene for scene, _, _ in scenes]
+            os.makedirs(scene_dir, exist_ok=True)
+            with open(plan_path, "w") as f:
+                json.dump(plan, f)
+        barrier_if_distributed()
+        with open(plan_path) as f:
+            plan = json.load(f)
+        inputs = [scene for source, scenes in plan.items() for scene in (scenes or [source])]
+        return inputs, {source: scenes for source, scenes in plan.items() if scenes}
+
+    def _join_scenes(scenes, outputs):
+        # wait until every rank has written its scenes
+        barrier_if_distributed()
+        parts = {
+            source: [os.path.join(tgt_path, os.path.basename(scene)) for scene in source_scenes]
+            for source, source_scenes in scenes.items()
+        }
+        restored = {part for source_parts in parts.values() for part in source_parts}
+        outputs = [output for output in outputs if output not in restored]
+        if get_global_rank() == 0:
+            for source, source_parts in parts.items():
+                filename = os.path.join(tgt_path, os.path.basename(source))
+                concat_videos(source_parts, filename, audio_source=source if copy_audio else None)
+                for part in source_parts:
+                    os.remove(part)
+                outputs.append(filename)
+                reporter("written", input=os.path.basename(source), path=filename)
+            shutil.rmtree(scene_dir, ignore_errors=True)
+        return outputs
+
+    def _is_tiled(video):
+        return bool(temporal_window) and not is_image_file(video)
+
+    def _restore_tiled(path, text_embeds):
+        # Restore a video in overlapping temporal windows so that memory does
+        # not depend on its duration; overlaps are cross-faded.
+        name = os.path.basename(path)
+        filename = os.path.join(tgt_path, name)
+        path = os.path.join(video_path, path)
+        info = probe_video(path)
+        save_fps = info.fps if out_fps is None else out_fps
+        window = valid_window_length(temporal_window, sp_size)
+        blender = TemporalBlender(temporal_blend)
+        # AdaIN statistics continue from window to window
+        adain_stream = AdaINStream(adain_stats, device=get_device()) if _use_adain() else None
+        # the next window is decoded while the current one is on the GPU
+        windows = iter(Prefetcher(
+            iter_video_windows(path, window, min(temporal_overlap, window - 1)),
+            depth=prefetch,
+        ))
+        writer = _open_writer(filename, path, save_fps)
+        written = 0
+        try:
+            current = next(windows, None)
+            while current is not None:
+                start, video = current
+                upcoming = next(windows, None)
+                print(f"Restoring frames {start}-{start + video.size(0) - 1} of {path}")
+                reporter("decode", input=name, frames=video.size(0), start=start, total=info.num_frames)
+                with profiler.stage("preprocess", name) as record:
+                    record["frames"] = video.size(0)
+                    record["bytes"] = video.numel() * video.element_size()
+                    record["plan"] = preprocess.plan(*video.shape[-2:])._asdict()
+                    # uint8 windows are uploaded chunk by chunk inside the preprocessor
+                    cond = _preprocess(video)
+                length = video.size(0)
+                pieces = padding.pieces(cond, length)
+                cond_latents = _encode(pieces, [name] * len(pieces))
+                samples = _generate(text_embeds, cond_latents, [name])
+                del cond_latents, pieces
+                sample, input = blender.add(
+                    start,
+                    padding.merge(samples, length),
+                    rearrange(cond[:, :length], "c t h w -> t c h w"),
+                    next_start=None if upcoming is None else upcoming[0],
+                )
+                if get_sequence_parallel_rank() == 0 and sample.size(0) > 0:
+                    preview = None
+                    if reporter.enabled:
+                        preview = os.path.join(preview_dir, f"{os.path.splitext(name)[0]}_{written:06d}.jpg")
+                    adain = None if adain_stream is None else adain_stream.params(sample, input)
+                    background.submit(
+                        _write_frames, writer, sample, input,
+                        name=name, done=written, total=info.num_frames, preview=preview, adain=adain,
+                    )
+                    written += sample.size(0)
+                del samples, sample, input, cond
+                current = upcoming
+        except BaseException:
+            try:
+                background.drain()
+            finally:
+                writer.abort()
+            raise
+        background.submit(_close_tiled, writer, name, filename)
+        if get_sequence_parallel_rank() == 0:
+            outputs.append(filename)
+
+    def _load_input(video):
+        name = os.path.basename(video)
+        with profiler.stage("decode", name, sync=False) as record:
+            video, fps = _decode_input(video)
+            record["frames"] = video.size(0)
+            record["bytes"] = video.numel() * video.element_size()
+        reporter("decode", input=name, frames=video.size(0))
+        return video, fps
+
+    def _decode_input(video):
+        if is_image_file(video):
+            from torchvision.io import read_image
+
+            video = read_image(
+                os.path.join(video_path, video)
+            ).unsqueeze(0).to(get_device())
+            if sp_size > 1:
+                raise ValueError("Sp size should be set to 1 for image inputs!")
+            return video, out_fps
+        # Decode in windows and keep frames in uint8 until they are on
+        # the device, so host memory does not scale with clip length.
+        video, fps = read_video_to_device(
+            os.path.join(video_path, video),
+            get_device(),
+            window=decode_window or 4 * sp_size + 1,
+        )
+        return video, fps if out_fps is None else out_fps
+
+    def _load_batch(videos):
+        # runs on the prefetch thread while the previous batch is on the GPU
+        return [_load_input(video) for video in videos if not _is_tiled(video)]
+
+    def _restore_batch(videos, loaded, text_embeds):
+        # read condition latents
+        cond_latents = []
+        cond_names = []
+        fps_lists = []
+        input_videos = []
+        num_pieces = []
+        all_repeats = []
+        for name, (video, fps) in zip(videos, loaded):
+            print(f"Read video size: {video.size()}")
+            with profiler.stage("preprocess", os.path.basename(name)) as record:
+                record["frames"] = video.size(0)
+                record["plan"] = preprocess.plan(*video.shape[-2:])._asdict()
+                repeats = None
+                if dedup_threshold is not None:
+                    keep, repeats = collapse_static_runs(video, dedup_threshold, dedup_min_run)
+                if repeats is not None:
+                    saved = compute_saved(video.size(0), keep.numel(), sp_size)
+                    print(
+                        f"Restoring {keep.numel()} of {video.size(0)} frames of {os.path.basename(name)}, "
+                        f"the rest repeat them ({saved:.0%} of the compute saved)"
+                    )
+                    record["dedup"] = {"kept": keep.numel(), "saved": saved}
+                    video = video[keep.to(video.device)]
+                all_repeats.append(repeats)
+                length = video.size(0)
+                video = _preprocess(video)
+                input_videos.append(video[:, :length])
+                pieces = padding.pieces(video, length)
+                cond_latents += pieces
+                cond_names += [os.path.basename(name)] * len(pieces)
+                num_pieces.append(len(pieces))
+            fps_lists.append(fps)
+        ori_lengths = [video.size(1) for video in input_videos]
+        names = [os.path.basename(video) for video in videos]
+        cond_latents = _encode(cond_latents, cond_names)
+        samples = _generate(text_embeds, cond_latents, names)
+        del cond_latents
+        # back to one sample per input, trimmed to its frames
+        merged = []
+        for count, ori_length in zip(num_pieces, ori_lengths):
+            merged.append(padding.merge(samples[:count], ori_length))
+            samples = samples[count:]
+        samples = merged
+        # dump samples to the output directory
+        if get_sequence_parallel_rank() == 0:
+            for path, input, sample, repeats, save_fps in zip(
+                videos, input_videos, samples, all_repeats, fps_lists
+            ):
+                filename = os.path.join(tgt_path, os.path.basename(path))
+                input = (
+                    rearrange(input[:, None], "c t h w -> t c h w")
+                    if input.ndim == 3
+                    else rearrange(input, "c t h w -> t c h w")
+                )
+                # colour fix and encoding overlap with the next batch
+                outputs.append(filename)
+                if sample.shape[0] == 1 and repeats is None:
+                    background.submit(_write_image, filename, sample, input)
+                else:
+                    background.submit(
+                        _write_video, filename, os.path.join(video_path, path), save_fps, sample, input,
+                        repeats,
+                    )
+
+    # classifier-free guidance
+    runner.config.diffusion.cfg.scale = float(os.environ.get("CFG_SCALE", cfg_scale))
+    runner.config.diffusion.cfg.rescale = float(os.environ.get("CFG_RESCALE", cfg_rescale))
+    # sampling steps
+    runner.config.diffusion.timesteps.sampling.steps = int(os.environ.get("SAMPLE_STEPS", sample_steps))
+    runner.configure_diffusion()
+    residency = runner.residency
+    spec = get_model_spec(runner.model)
+    res_h = spec.res_h if res_h is None else res_h
+    res_w = spec.res_w if res_w is None else res_w
+    # set random seed
+    set_seed(seed, same_across_ranks=True)
+    os.makedirs(output_dir, exist_ok=True)
+    tgt_path = output_dir
+    # progress events; a no-op unless a callback is given
+    reporter = ProgressReporter(progress)
+    preview_dir = os.path.join(output_dir, ".previews")
+    if reporter.enabled:
+        os.makedirs(preview_dir, exist_ok=True)
+    # per-stage timings and memory peaks as JSON lines; free when disabled
+    profiler = NULL_PROFILER
+    if profile:
+        profiler = StageProfiler(profile, get_device(), rank=get_global_rank())
+    # get test prompts
+    video_path, video_list = _list_inputs(video_path)
+    scene_dir = os.path.join(output_dir, ".scenes")
+    scenes = {}
+    if scene_split:
+        video_list, scenes = _split_scenes(video_path, video_list)
+        video_path = ""
+    scene_files = {scene for source_scenes in scenes.values() for scene in source_scenes}
+    original_videos, _, _ = _build_test_prompts(video_list)
+    # read shapes from the container metadata, without decoding
+    input_keys = probe_keys(original_videos, video_path, res_h, res_w, sp_size)
+    # divide the prompts into groups of about equal cost (frames x pixels)
+    num_groups = get_data_parallel_world_size() // get_sequence_parallel_world_size()
+    group_rank = get_data_parallel_rank() // get_sequence_parallel_world_size()
+    original_videos_group = partition_lpt(
+        original_videos, estimate_costs(original_videos, input_keys), num_groups
+    )
+    # batch inputs of identical post-transform shape together
+    if memory_budget_gb is not None:
+        memory_budget = int(memory_budget_gb * 1024 ** 3)
+    elif torch.cuda.is_available():
+        # the smallest free memory of all ranks, so that every rank cuts
+        # every group into the same batches
+        memory_budget = torch.tensor(torch.cuda.mem_get_info(get_device())[0], device=get_device())
+        if torch.distributed.is_initialized():
+            torch.distributed.all_reduce(memory_budget, op=torch.distributed.ReduceOp.MIN)
+        memory_budget = int(memory_budget.item())
+    else:
+        memory_budget = None
+
+    def _batches(group):
+        return bucket_inputs(
+            original_videos_group[group],
+            input_keys,
+            batch_size=batch_size,
+            memory_budget=memory_budget,
+            max_batch_size=max_batch_size,
+        )
+
+    original_videos_local = _batches(group_rank)
+    queue = None
+    if work_queue and get_sequence_parallel_world_size() > 1:
+        print("Work stealing needs sp_size 1, using the static partition only")
+    elif work_queue:
+        # ranks that finish early take inputs other ranks have not started;
+        # claims are scoped to this call so warm workers can run again
+        run_id = [uuid.uuid4().hex]
+        if torch.distributed.is_initialized():
+            torch.distributed.broadcast_object_list(run_id, src=0)
+        queue = WorkQueue(work_queue, run_id[0])
+        original_videos_local = queue.iter_batches(
+            original_videos_local,
+            [_batches(group) for group in range(num_groups) if group != group_rank],
+        )
+    # text embeddings are loaded once per process and stay on the device
+    embedding_cache = get_embedding_cache(get_device())
+    from tqdm import tqdm
+
+    # fused resize, crop and normalise of uint8 frames (upsamples too, the
+    # model was only trained for high res)
+    preprocess = VideoPreprocessor(res_h, res_w, get_device(), downsample_only=False)
+    padding = TemporalPadding(temporal_padding, sp_size)
+    if dedup_threshold is not None and temporal_window:
+        print("Duplicate frame skipping is not applied to videos restored in temporal windows")
+    # generation loop
+    outputs = []
+    background = BackgroundWriter(max_pending=write_queue)
+    # host staging for output frames, only touched by the writer
+    frame_buffer = FrameBuffer()
+    batches = Prefetcher(original_videos_local, _load_batch, depth=prefetch)
+    try:
+        for videos, loaded in tqdm(batches):
+            text_embeds = embedding_cache.text_embeds(positive_prompt, negative_prompt)
+            # videos in temporal-window mode go through the windowed path one by one
+            for video in videos:
+                if _is_tiled(video):
+                    _restore_tiled(video, text_embeds)
+            if loaded:
+                videos = [video for video in videos if not _is_tiled(video)]
+                _restore_batch(videos, loaded, text_embeds)
+            del loaded
+            residency.report()
+            gc.collect()
+            torch.cuda.empty_cache()
+    finally:
+        try:
+            # re-raises the first writer failure, JobCancelled included
+            background.close()
+        finally:
+            profiler.summary()
+            profiler.close()
+    if queue is not None:
+        barrier_if_distributed()
+        if get_global_rank() == 0:
+            shutil.rmtree(queue.root, ignore_errors=True)
+    if scenes:
+        outputs = _join_scenes(scenes, outputs)
+    return outputs
+
+class Engine:
+    """A configured runner for one model, reused across ``restore`` calls."""
+
+    def __init__(self, model, sp_size=1, residency="auto", residency_headroom_gb=None,
+                 checkpoint_cache_dir=DEFAULT_CACHE_DIR):
+        self.model = model
+        self.sp_size = sp_size
+        self.spec = get_model_spec(model)
+        self.runner = configure_runner(
+            model, sp_size, residency, residency_headroom_gb, checkpoint_cache_dir
+        )
+
+    def restore(self, inputs, params=None):
+        """
+        Restore ``inputs`` (a directory, a file or a list of files) with the
+        ``generation_loop`` keyword arguments in ``params`` and return the
+        paths written by this process.
+        """
+        return generation_loop(self.runner, inputs, sp_size=self.sp_size, **(params or {}))
+
+
+_engines = {}
+
+
+def get_engine(model, sp_size=1):
+    """Return the engine shared by everything in this process for ``model``."""
+    key = (model, sp_size)
+    if key not in _engines:
+        _engines[key] = Engine(model, sp_size)
+    return _engines[key]
+
+
+def restore(inputs, params=None):
+    """``Engine.restore`` on the process-wide engine for ``params["model"]`` (default 3B)."""
+    params = dict(params or {})
+    model = params.pop("model", "3B")
+    sp_size = params.pop("sp_size", 1)
+    return get_engine(model, sp_size).restore(inputs, params)
+
+
+def main(model=None):
+    """Command line entry point; the per-model scripts pass their ``model``."""
+    parser = argparse.ArgumentParser()
+    if model is None:
+        parser.add_argument("--model", type=str, default="3B", choices=sorted(MODEL_REGISTRY))
+    parser.add_argument("--video_path", type=str, default="./test_videos")
+    parser.add_argument("--output_dir", type=str, default="./results")
+    parser.add_argument("--seed", type=int, default=666)
+    parser.add_argument("--res_h", type=int, default=None,
+                        help="Output height (default: the model's default resolution)")
+    parser.add_argument("--res_w", type=int, default=None)
+    parser.add_argument("--sp_size", type=int, default=1)
+    parser.add_argument("--out_fps", type=float, default=None)
+    parser.add_argument("--batch_size", type=int, default=0,
+                        help="Inputs per batch within a shape bucket (0 picks it from the memory budget)")
+    parser.add_argument("--max_batch_size", type=int, default=16)
+    parser.add_argument("--memory_budget_gb", type=float, default=None,
+                        help="Device memory available to a batch (default: free memory at start)")
+    parser.add_argument("--work_queue", type=str, default=None,
+                        help="Directory shared by all ranks; idle ranks take unstarted inputs from it")
+    parser.add_argument("--decode_window", type=int, default=None,
+                        help="Frames decoded per window (default: 4 * sp_size + 1)")
+    parser.add_argument("--temporal_window", type=int, default=None,
+                        help="Restore videos in overlapping windows of this many frames")
+    parser.add_argument("--temporal_overlap", type=int, default=8,
+                        help="Frames shared by consecutive temporal windows")
+    parser.add_argument("--temporal_blend", type=str, default="linear", choices=BLEND_MODES,
+                        help="Cross-fade used on the overlapping frames")
+    parser.add_argument("--color_fix", type=str, default=COLOR_FIX_MODES[0], choices=COLOR_FIX_MODES,
+                        help="wavelet: exact wavelet colour fix, pyramid: faster approximation, "
+                             "adain: per-channel mean/std transfer, cheapest")
+    parser.add_argument("--adain_stats", type=str, default="ema", choices=ADAIN_STATS,
+                        help="AdaIN statistics per frame, per clip, or per frame smoothed over time")
+    parser.add_argument("--temporal_padding", type=str, default="replicate", choices=PADDING_MODES,
+                        help="How clips are brought to a valid length: repeat or mirror the last "
+                             "frames, or restore the tail from a second window (trim)")
+    parser.add_argument("--scene_split", action="store_true",
+                        help="Cut videos at shot boundaries and restore the scenes as separate inputs")
+    parser.add_argument("--scene_threshold", type=float, default=0.35,
+                        help="Luma histogram difference (0-1) between frames that counts as a cut")
+    parser.add_argument("--scene_min_frames", type=int, default=16,
+                        help="Shortest scene; cuts closer than this to the previous one are ignored")
+    parser.add_argument("--dedup_threshold", type=float, default=None,
+                        help="Restore runs of frames within this mean luma difference (0-255) of "
+                             "their first frame only once (default: off)")
+    parser.add_argument("--dedup_min_run", type=int, default=4,
+                        help="Shortest run of duplicate frames that is collapsed")
+    parser.add_argument("--video_codec", type=str, default="libx264")
+    parser.add_argument("--video_crf", type=int, default=18)
+    parser.add_argument("--video_preset", type=str, default="medium")
+    parser.add_argument("--no_audio", dest="copy_audio", action="store_false",
+                        help="Do not copy the input's audio into the output")
+    parser.add_argument("--prefetch", type=int, default=1,
+                        help="Inputs decoded ahead of the GPU (0 disables prefetching)")
+    parser.add_argument("--write_queue", type=int, default=2,
+                        help="Outputs queued for background colour fix and encoding (0 writes inline)")
+    parser.add_argument("--positive_prompt", type=str, default=None,
+                        help="Use the registered embedding of this prompt instead of pos_emb.pt")
+    parser.add_argument("--negative_prompt", type=str, default=None,
+                        help="Use the registered embedding of this prompt instead of neg_emb.pt")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="Append per-stage timings and memory peaks to this JSON-lines file")
+    parser.add_argument("--residency", type=str, default="auto", choices=RESIDENCY_POLICIES,
+                        help="Where the DiT and VAE live between stages (auto picks from free memory)")
+    parser.add_argument("--residency_headroom_gb", type=float, default=None,
+                        help="Device memory kept free for activations when deciding residency "
+                             "(default: the model's memory profile)")
+    parser.add_argument("--checkpoint_cache_dir", type=str, default=DEFAULT_CACHE_DIR,
+                        help="Where converted safetensors checkpoints are kept (empty to load the .pth directly)")
+    args = parser.parse_args()
+    if args.dedup_threshold is not None and args.temporal_window:
+        parser.error("--dedup_threshold cannot be combined with --temporal_window")
+    model = args.__dict__.pop("model", model)
+    engine = Engine(
+        model, args.sp_size, residency=args.residency, residency_headroom_gb=args.residency_headroom_gb,
+        checkpoint_cache_dir=args.checkpoint_cache_dir,
+    )
+    del args.residency, args.residency_headroom_gb, args.checkpoint_cache_dir, args.sp_size
+    engine.restore(args.__dict__.pop("video_path"), vars(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Temporal padding of model inputs to a length the model accepts.
+
+The VAE and DiT need ``(t - 1) % (4 * sp_size) == 0``. ``cut_videos`` used
+to reach that by concatenating copies of the last frame, which copied the
+whole clip. Here the preprocessor allocates the padded length up front
+(``buffer_length``), and ``fill_`` writes only the padding frames, in place.
+Modes:
+
+- ``replicate``: repeat the last frame (the original behaviour);
+- ``reflect``: mirror the last frames, so motion continues instead of
+  freezing for the padded tail;
+- ``trim``: no padding. The longest valid prefix is restored, and the
+  remaining frames come from a second, valid-length window that ends on the
+  last frame. That window's overlap with the prefix is recomputed, so the
+  compute is about the same as padding, but every input frame is real.
+
+``pieces`` returns the tensors to restore for one clip (views of the
+buffer, no copies) and ``merge`` turns their samples back into exactly the
+input's frames.
+"""
+import torch
+
+from bucketing import padded_length
+
+PADDING_MODES = ("replicate", "reflect", "trim")
+
+
+class TemporalPadding:
+    def __init__(self, mode="replicate", sp_size=1):
+        if mode not in PADDING_MODES:
+            raise ValueError(f"Unknown padding mode: {mode}")
+        self.mode = mode
+        self.step = 4 * sp_size
+        self.sp_size = sp_size
+
+    def _trimmed(self, length):
+        """Length of the valid prefix in trim mode, or None when the clip is padded instead."""
+        if self.mode != "trim" or length <= self.step or (length - 1) % self.step == 0:
+            return None
+        return (length - 1) // self.step * self.step + 1
+
+    def buffer_length(self, length):
+        """Frames to allocate for a clip of ``length`` frames."""
+        if self._trimmed(length) is not None:
+            return length
+        return padded_length(length, self.sp_size)
+
+    def fill_(self, buffer, length):
+        """Write the padding frames of a ``(C, T, H, W)`` buffer after its first ``length`` frames."""
+        pad = buffer.size(1) - length
+        if pad <= 0:
+            return buffer
+        if self.mode == "reflect" and length > 1:
+            # mirror back and forth when the padding is longer than the clip
+            period = 2 * (length - 1)
+            index = torch.arange(length, length + pad) % period
+            index = torch.where(index >= length, period - index, index)
+            buffer[:, length:].copy_(buffer[:, index.to(buffer.device)])
+        else:
+            buffer[:, length:].copy_(buffer[:, length - 1:length].expand(-1, pad, -1, -1))
+        return buffer
+
+    def pieces(self, buffer, length):
+        """The ``(C, T, H, W)`` inputs to restore for one clip."""
+        trimmed = self._trimmed(length)
+        if trimmed is None:
+            return [buffer]
+        tail = self.step + 1
+        return [buffer[:, :trimmed], buffer[:, length - tail:length]]
+
+    def merge(self, samples, length):
+        """
+        The ``(T, C, H, W)`` output for the first ``length`` frames, from the
+        samples of ``pieces``.
+        """
+        if len(samples) == 1:
+            return samples[0][:length]
+        head, tail = samples
+        trimmed = self._trimmed(length)
+        return torch.cat([head[:trimmed], tail[tail.size(0) - (length - trimmed):]])
@@ -0,0 +1,105 @@
+"""Temporal tiling helpers for restoring videos in overlapping windows.
+
+Windows are restored independently and their overlapping frames are
+cross-faded, so the memory needed per job depends on the window length
+rather than on the clip duration.
+"""
+import math
+
+import torch
+
+BLEND_MODES = ("linear", "cosine", "none")
+
+
+def valid_window_length(window, sp_size):
+    """
+    Round ``window`` down to a length accepted by the model, i.e. one with
+    ``(t - 1) % (4 * sp_size) == 0``.
+    """
+    step = 4 * sp_size
+    return max(step + 1, (window - 1) // step * step + 1)
+
+
+def crossfade_ramp(length, mode="linear", device=None):
+    """
+    Weights rising from 0 to 1 over ``length`` overlapping frames. The ramp of
+    the incoming window and the flipped ramp of the outgoing window sum to 1.
+    """
+    pos = torch.arange(1, length + 1, device=device, dtype=torch.float32) / (length + 1)
+    if mode == "linear":
+        return pos
+    if mode == "cosine":
+        return 0.5 - 0.5 * torch.cos(math.pi * pos)
+    if mode == "none":
+        # Hard switch at the middle of the overlap.
+        return (pos >= 0.5).float()
+    raise ValueError(f"Unknown blend mode: {mode}")
+
+
+class TemporalBlender:
+    """
+    Accumulates the outputs of overlapping windows and hands back frames as
+    soon as no later window can contribute to them.
+
+    Frames are ``(T, C, H, W)`` tensors; ``cond`` carries the matching
+    condition frames so the colour fix can run on finished frames only.
+    """
+
+    def __init__(self, mode="linear"):
+        if mode not in BLEND_MODES:
+            raise ValueError(f"Unknown blend mode: {mode}")
+        self.mode = mode
+        self._start = 0
+        self._acc = None
+        self._weight = None
+        self._cond = None
+
+    @property
+    def _end(self):
+        return self._start + (0 if self._acc is None else self._acc.size(0))
+
+    def add(self, start, samples, cond, next_start=None):
+        """
+        Add the output of the window starting at frame ``start``. ``next_start``
+        is the first frame of the following window, or None for the last one.
+        Returns the ``(samples, cond)`` frames that are final, possibly empty.
+        """
+        length = samples.size(0)
+        weight = torch.ones(length, device=samples.device, dtype=torch.float32)
+        overlap_in = max(0, self._end - start) if self._acc is not None else 0
+        if overlap_in:
+            weight[:overlap_in] *= crossfade_ramp(overlap_in, self.mode, samples.device)
+        overlap_out = max(0, start + length - next_start) if next_start is not None else 0
+        if overlap_out:
+            weight[length - overlap_out:] *= crossfade_ramp(
+                overlap_out, self.mode, samples.device
+            ).flip(0)
+
+        if self._acc is None:
+            self._start = start
+            self._acc = samples.float() * weight[:, None, None, None]
+            self._weight = weight
+            self._cond = cond
+        else:
+            assert start >= self._start, "windows must be added in order"
+            offset = start - self._start
+            new = start + length - self._end
+            if new > 0:
+                self._acc = torch.cat([self._acc, self._acc.new_zeros((new, *self._acc.shape[1:]))])
+                self._weight = torch.cat([self._weight, self._weight.new_zeros(new)])
+                self._cond = torch.cat([self._cond, cond[length - new:]])
+            self._acc[offset:offset + length].add_(samples.float() * weight[:, None, None, None])
+            self._weight[offset:offset + length].add_(weight)
+
+        return self._pop(self._end if next_start is None else next_start)
+
+    def _pop(self, until):
+        count = max(0, min(until, self._end) - self._start)
+        weight = self._weight[:count].clamp_min(1e-8)[:, None, None, None]
+        samples = self._acc[:count] / weight
+        cond = self._cond[:count]
+        self._acc = self._acc[count:]
+        self._weight = self._weight[count:]
+        self._cond = self._cond[count:]
+        self._start += count
+        return samples, cond
@@ -0,0 +1,34 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("av")
+pytest.importorskip("PIL")
+
+from dedup import collapse_static_runs  # noqa: E402
+
+
+def _video(runs):
+    # one flat grey frame per run, each run a different level
+    frames = [torch.full((length, 3, 72, 128), 20 * index, dtype=torch.uint8)
+              for index, length in enumerate(runs)]
+    return torch.cat(frames)
+
+
+@pytest.mark.parametrize("runs", [
+    [6, 1, 2, 9],
+    [4, 4, 4],
+    [1, 1, 5, 1, 1],
+    [3, 12],
+])
+def test_repeating_kept_frames_restores_the_video(runs):
+    video = _video(runs)
+    keep, repeats = collapse_static_runs(video, threshold=1.0, min_run=4)
+    assert keep is not None
+    assert int(repeats.sum()) == video.size(0)
+    restored = video[keep].repeat_interleave(repeats, dim=0)
+    assert torch.equal(restored, video)
+
+
+def test_nothing_to_collapse():
+    assert collapse_static_runs(_video([1, 2, 3, 1])) == (None, None)
+    assert collapse_static_runs(_video([3])) == (None, None)
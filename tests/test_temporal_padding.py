@@ -0,0 +1,36 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("av")
+pytest.importorskip("PIL")
+
+from temporal_padding import PADDING_MODES, TemporalPadding  # noqa: E402
+
+
+def _lengths(step):
+    lengths = {1, 2, 3}
+    for k in range(1, 4):
+        lengths.update(k * step + offset for offset in (-1, 0, 1, 2))
+    return sorted(lengths)
+
+
+def _buffer(padding, length):
+    # frame i holds the value i, so the output order can be read back
+    buffer = torch.empty(1, padding.buffer_length(length), 1, 1)
+    buffer[0, :length, 0, 0] = torch.arange(length, dtype=buffer.dtype)
+    return padding.fill_(buffer, length)
+
+
+@pytest.mark.parametrize("sp_size", [1, 2])
+@pytest.mark.parametrize("mode", PADDING_MODES)
+def test_merge_of_pieces_returns_every_frame_in_order(mode, sp_size):
+    padding = TemporalPadding(mode, sp_size)
+    for length in _lengths(padding.step):
+        pieces = padding.pieces(_buffer(padding, length), length)
+        for piece in pieces:
+            assert (piece.size(1) - 1) % padding.step == 0, (length, piece.size(1))
+        # an identity model: each sample is its (C, T, H, W) piece as (T, C, H, W)
+        samples = [piece.permute(1, 0, 2, 3) for piece in pieces]
+        merged = padding.merge(samples, length)
+        assert merged.size(0) == length
+        assert torch.equal(merged[:, 0, 0, 0], torch.arange(length, dtype=merged.dtype)), length
@@ -0,0 +1,248 @@
+"""Streaming video IO for the inference scripts.
+
+Frames are decoded with PyAV in fixed-size windows and kept as uint8 until
+they reach the device, so host memory scales with the window size instead of
+the clip length. Results are encoded the same way, frame chunk by frame chunk,
+through an ffmpeg pipe.
+"""
+import os
+import subprocess
+import tempfile
+from collections import namedtuple
+
+import av
+import torch
+
+# Frame rate assumed for streams that carry none.
+DEFAULT_FPS = 30.0
+
+VideoInfo = namedtuple("VideoInfo", ["num_frames", "fps", "height", "width"])
+
+
+def probe_video(path):
+    """
+    Read frame count, frame rate and size from the container metadata without
+    decoding. ``num_frames`` is an estimate from the duration when the
+    container does not store an exact count. Streams without a frame rate
+    report ``DEFAULT_FPS``.
+    """
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        rate = stream.average_rate or stream.guessed_rate or stream.base_rate
+        fps = float(rate) if rate else 0.0
+        if fps <= 0:
+            print(f"No frame rate in {path}, assuming {DEFAULT_FPS:g} fps")
+            fps = DEFAULT_FPS
+        num_frames = stream.frames
+        if not num_frames and fps:
+            if stream.duration is not None and stream.time_base is not None:
+                num_frames = round(float(stream.duration * stream.time_base) * fps)
+            elif container.duration is not None:
+                num_frames = round(container.duration / av.time_base * fps)
+        return VideoInfo(
+            int(num_frames or 0), fps, stream.codec_context.height, stream.codec_context.width
+        )
+
+
+def iter_video_windows(path, window, overlap=0):
+    """
+    Decode a video and yield ``(start, frames)`` pairs, where ``frames`` is a
+    uint8 ``(T, C, H, W)`` tensor of at most ``window`` frames starting at frame
+    index ``start``. Consecutive windows share ``overlap`` frames; the last
+    window may be shorter.
+    """
+    assert 0 <= overlap < window, "overlap must be smaller than the window"
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        buffer = []
+        start = 0
+        for frame in container.decode(stream):
+            buffer.append(torch.from_numpy(frame.to_ndarray(format="rgb24")))
+            if len(buffer) == window:
+                yield start, torch.stack(buffer).permute(0, 3, 1, 2)
+                buffer = buffer[window - overlap:]
+                start += window - overlap
+        # After the first window the buffer starts with already emitted frames.
+        if len(buffer) > (overlap if start > 0 else 0):
+            yield start, torch.stack(buffer).permute(0, 3, 1, 2)
+
+
+def read_video_to_device(path, device, window):
+    """
+    Decode a whole video window by window straight onto ``device``.
+    Returns the uint8 ``(T, C, H, W)`` video and its frame rate.
+
+    The video is allocated once at the probed frame count and every window is
+    copied into it, so the device never holds the frames twice. Frames beyond
+    an underestimated count are appended at the end; that is every frame of
+    a stream without a frame count, such as raw h264.
+    """
+    info = probe_video(path)
+    video = torch.empty((info.num_frames, 3, info.height, info.width), dtype=torch.uint8, device=device)
+    filled = 0
+    overflow = []
+    for _, frames in iter_video_windows(path, window):
+        fit = min(frames.size(0), video.size(0) - filled)
+        if fit:
+            video[filled:filled + fit].copy_(frames[:fit])
+            filled += fit
+        if fit < frames.size(0):
+            overflow.append(frames[fit:].to(device))
+    if not filled and not overflow:
+        raise ValueError(f"No frames decoded from {path}")
+    if overflow:
+        chunks = ([video[:filled]] if filled else []) + overflow
+        return (chunks[0] if len(chunks) == 1 else torch.cat(chunks)), info.fps
+    return video[:filled], info.fps
+
+
+class VideoWriter:
+    """
+    Encode frames incrementally by piping raw RGB into an ffmpeg subprocess,
+    so encoding starts with the first frame and the whole output never has to
+    be held in memory. When ``audio_source`` is given its audio streams are
+    stream-copied into the result once the video is complete.
+    """
+
+    def __init__(self, path, fps, codec="libx264", crf=18, preset="medium",
+                 pix_fmt="yuv420p", audio_source=None, ffmpeg="ffmpeg"):
+        if not fps or fps <= 0:
+            raise ValueError(f"Invalid frame rate {fps!r} for {path}")
+        self.path = path
+        self.fps = fps
+        self.codec = codec
+        self.crf = crf
+        self.preset = preset
+        self.pix_fmt = pix_fmt
+        self.audio_source = audio_source
+        self.ffmpeg = ffmpeg
+        self.frames_written = 0
+        self._process = None
+        self._log = None
+        root, ext = os.path.splitext(path)
+        self._video_path = f"{root}.noaudio{ext}" if audio_source else path
+
+    def _start(self, height, width):
+        command = [
+            self.ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}", "-r", str(self.fps),
+            "-i", "pipe:0",
+            "-c:v", self.codec,
+        ]
+        if self.preset is not None:
+            command += ["-preset", str(self.preset)]
+        if self.crf is not None:
+            command += ["-crf", str(self.crf)]
+        command += ["-pix_fmt", self.pix_fmt, self._video_path]
+        self._log = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._log
+        )
+
+    def write(self, frames):
+        """Append uint8 ``(T, H, W, C)`` frames, as a tensor or numpy array."""
+        if isinstance(frames, torch.Tensor):
+            frames = frames.cpu().contiguous().numpy()
+        if self._process is None:
+            self._start(frames.shape[1], frames.shape[2])
+        try:
+            self._process.stdin.write(memoryview(frames).cast("B"))
+        except BrokenPipeError:
+            self._fail()
+        self.frames_written += frames.shape[0]
+
+    def _fail(self):
+        self._process.kill()
+        self._process.wait()
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._process = None
+        try:
+            self._log.seek(0)
+            error = self._log.read().decode(errors="replace")
+        finally:
+            self._log.close()
+        raise RuntimeError(f"ffmpeg failed writing {self.path}: {error}")
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self._process.wait() != 0:
+            self._fail()
+        self._log.close()
+        self._process = None
+        if self.audio_source:
+            mux_audio(self._video_path, self.audio_source, self.path, ffmpeg=self.ffmpeg)
+
+    def abort(self):
+        """Stop ffmpeg without finalising the output."""
+        if self._process is None:
+            return
+        self._process.kill()
+        self._process.wait()
+        self._log.close()
+        self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def mux_audio(video_path, audio_source, output_path, ffmpeg="ffmpeg"):
+    """
+    Stream-copy ``video_path`` plus any audio streams of ``audio_source`` into
+    ``output_path`` and remove ``video_path``. If the audio cannot be copied
+    into the container the silent video is kept.
+    """
+    command = [
+        ffmpeg, "-y", "-loglevel", "error",
+        "-i", video_path, "-i", audio_source,
+        "-map", "0:v:0", "-map", "1:a?", "-c", "copy", "-shortest",
+        output_path,
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode == 0:
+        os.remove(video_path)
+    else:
+        print(f"Could not copy audio from {audio_source}, keeping silent video: {result.stderr}")
+        os.replace(video_path, output_path)
+
+
+def concat_videos(paths, output_path, audio_source=None, ffmpeg="ffmpeg"):
+    """
+    Join ``paths``, encoded with the same settings, into ``output_path`` by
+    stream copy (no re-encoding), then copy in the audio of ``audio_source``.
+    """
+    root, ext = os.path.splitext(output_path)
+    video_path = f"{root}.noaudio{ext}" if audio_source else output_path
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as listing:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            listing.write(f"file '{escaped}'\n")
+    command = [
+        ffmpeg, "-y", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", listing.name,
+        "-c", "copy", video_path,
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    finally:
+        os.remove(listing.name)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed joining {output_path}: {result.stderr}")
+    if audio_source:
+        mux_audio(video_path, audio_source, output_path, ffmpeg=ffmpeg)
@@ -0,0 +1,261 @@
+"""Pool of warm inference workers, one per (model, sp_size).
+
+Each worker is a ``torchrun`` process running ``projects/inference_worker.py``
+that keeps its configured runner in memory between jobs. Workers that sit idle
+longer than ``idle_timeout`` are shut down, and at most ``max_workers`` stay
+resident so a 3B and a 7B runner don't both hold GPU memory forever.
+"""
+import os
+import secrets
+import socket
+import subprocess
+import threading
+import time
+from multiprocessing.connection import Client
+
+WORKER_SCRIPT = "projects/inference_worker.py"
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+class WorkerCancelled(WorkerError):
+    pass
+
+
+class InferenceWorker:
+    def __init__(self, model, sp_size=1, startup_timeout=1800):
+        self.model = model
+        self.sp_size = sp_size
+        self.startup_timeout = startup_timeout
+        self.port = _free_port()
+        self.authkey = secrets.token_bytes(32)
+        self.process = None
+        self.last_used = time.monotonic()
+        # One job at a time per worker; the runner is not re-entrant.
+        self.lock = threading.Lock()
+
+    def start(self):
+        command = [
+            "torchrun",
+            "--nproc-per-node=1",
+            f"--master-port={_free_port()}",
+            WORKER_SCRIPT,
+            "--model", self.model,
+            "--port", str(self.port),
+            "--sp_size", str(self.sp_size),
+        ]
+        env = os.environ.copy()
+        env["SEEDVR_WORKER_AUTHKEY"] = self.authkey.hex()
+        print(f"Starting inference worker: {' '.join(command)}")
+        self.process = subprocess.Popen(command, env=env)
+        self._wait_ready()
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if not self.alive():
+                raise WorkerError(
+                    f"Inference worker for {self.model} exited during startup "
+                    f"(code {self.process.returncode})"
+                )
+            try:
+                self._request({"cmd": "ping"})
+                print(f"Inference worker for {self.model} is ready")
+                return
+            except (ConnectionRefusedError, OSError):
+                time.sleep(1.0)
+        self.stop()
+        raise WorkerError(f"Inference worker for {self.model} did not start in time")
+
+    def _request(self, message):
+        with Client(("127.0.0.1", self.port), authkey=self.authkey) as conn:
+            conn.send(message)
+            return conn.recv()
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, params, on_event=None, cancel=None):
+        """
+        Run one job and return its output paths. Progress events are passed
+        to ``on_event``; setting the ``cancel`` event stops the job at its
+        next progress point and raises ``WorkerCancelled``.
+        """
+        with self.lock:
+            self.last_used = time.monotonic()
+            try:
+                reply = self._run(params, on_event, cancel)
+            except (EOFError, OSError) as e:
+                raise WorkerError(f"Lost connection to inference worker for {self.model}: {e}")
+            finally:
+                self.last_used = time.monotonic()
+        if reply["status"] == "cancelled":
+            raise WorkerCancelled(f"Job on inference worker for {self.model} was cancelled")
+        if reply["status"] != "ok":
+            raise WorkerError(reply.get("error", "unknown worker error"))
+        return reply.get("outputs", [])
+
+    def _run(self, params, on_event, cancel):
+        progress = on_event is not None or cancel is not None
+        with Client(("127.0.0.1", self.port), authkey=self.authkey) as conn:
+            conn.send({"cmd": "run", "params": params, "progress": progress})
+            cancel_sent = False
+            while True:
+                if cancel is not None and cancel.is_set() and not cancel_sent:
+                    conn.send({"cmd": "cancel"})
+                    cancel_sent = True
+                if not conn.poll(0.5):
+                    continue
+                reply = conn.recv()
+                if reply["status"] != "progress":
+                    return reply
+                if on_event is not None:
+                    on_event(reply["event"])
+
+    def stop(self, timeout=30):
+        if not self.alive():
+            return
+        try:
+            self._request({"cmd": "shutdown"})
+            self.process.wait(timeout=timeout)
+        except Exception:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class WorkerPool:
+    """
+    Workers are leased for the duration of a job. A worker with leases is
+    never evicted or reaped. When ``max_workers`` are resident and all of
+    them are leased, a request for another model waits for a lease to end
+    instead of starting one more worker. Workers start and stop outside the
+    pool lock, so a slow start does not hold up other models' jobs.
+    """
+
+    def __init__(self, idle_timeout=600, max_workers=1):
+        self.idle_timeout = idle_timeout
+        self.max_workers = max_workers
+        self._workers = {}
+        self._leases = {}
+        self._starting = set()
+        self._cond = threading.Condition()
+        self._reaper = threading.Thread(target=self._reap_idle, daemon=True)
+        self._reaper.start()
+
+    def _idle(self, key):
+        return key not in self._starting and not self._leases.get(self._workers[key])
+
+    def _acquire(self, model, sp_size):
+        key = (model, sp_size)
+        with self._cond:
+            while True:
+                worker = self._workers.get(key)
+                if worker is not None and key not in self._starting and not worker.alive():
+                    print(f"Inference worker for {model} died, restarting")
+                    del self._workers[key]
+                    worker = None
+                if worker is not None and key not in self._starting:
+                    self._leases[worker] = self._leases.get(worker, 0) + 1
+                    # Keep the reaper from stopping it before the job is submitted.
+                    worker.last_used = time.monotonic()
+                    return worker
+                if worker is None:
+                    evicted = self._evict_for_new_worker()
+                    if len(self._workers) < self.max_workers:
+                        break
+                    if evicted:
+                        # stopped outside the lock, then try again
+                        self._cond.release()
+                        try:
+                            self._stop_all(evicted)
+                        finally:
+                            self._cond.acquire()
+                        continue
+                # wait for the worker to start, or for a lease to end
+                self._cond.wait()
+            # placeholder: callers for the same key wait for this start
+            worker = InferenceWorker(model, sp_size)
+            self._workers[key] = worker
+            self._starting.add(key)
+        try:
+            self._stop_all(evicted)
+            worker.start()
+        except BaseException:
+            with self._cond:
+                del self._workers[key]
+                self._starting.discard(key)
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._starting.discard(key)
+            self._leases[worker] = 1
+            worker.last_used = time.monotonic()
+            self._cond.notify_all()
+        return worker
+
+    def _release(self, worker):
+        with self._cond:
+            self._leases[worker] -= 1
+            if not self._leases[worker]:
+                del self._leases[worker]
+            worker.last_used = time.monotonic()
+            self._cond.notify_all()
+
+    def _evict_for_new_worker(self):
+        # Least recently used idle workers go first; leased ones are never
+        # evicted. Returns the removed workers, to be stopped without the lock.
+        idle = sorted(
+            (key for key in self._workers if self._idle(key)),
+            key=lambda key: self._workers[key].last_used,
+        )
+        evicted = []
+        while len(self._workers) >= self.max_workers and idle:
+            worker = self._workers.pop(idle.pop(0))
+            print(f"Evicting inference worker for {worker.model}")
+            evicted.append(worker)
+        return evicted
+
+    @staticmethod
+    def _stop_all(workers):
+        for worker in workers:
+            worker.stop()
+
+    def run(self, model, params, sp_size=1, on_event=None, cancel=None):
+        """Run a job on the worker for ``model`` and return its output paths."""
+        worker = self._acquire(model, sp_size)
+        try:
+            return worker.run(params, on_event=on_event, cancel=cancel)
+        finally:
+            self._release(worker)
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(min(60, max(1, self.idle_timeout / 4)))
+            with self._cond:
+                now = time.monotonic()
+                expired = [
+                    self._workers.pop(key) for key, worker in list(self._workers.items())
+                    if self._idle(key) and (now - worker.last_used > self.idle_timeout or not worker.alive())
+                ]
+                if expired:
+                    self._cond.notify_all()
+            for worker in expired:
+                print(f"Stopping idle inference worker for {worker.model}")
+                worker.stop()
+
+    def shutdown(self):
+        with self._cond:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        self._stop_all(workers)